@@ -1,11 +1,28 @@
 import os
-import openai
+import time
+import random
+import hashlib
+import threading
+from datetime import datetime, timedelta
+import logging
 import numpy as np
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from models import ChatbotKnowledge, ChatHistory
-from app import db
+from models import ChatbotKnowledge
+from app import app, db
+from knowledge_index import KnowledgeIndex, KnowledgeRecord, RecordTable, normalize_question
+from llm_dispatch import llm_dispatcher, LLMOverloaded, LLMTimeout
+from llm_provider import create_llm_provider
+from response_cache import create_response_cache
+from conversation_memory import conversation_memory, estimate_tokens, is_follow_up
+from metrics import span, record_cache, llm_errors, llm_tokens
+from model_trainer import create_trainer
+import model_store
+from retrieval import create_retriever, load_retriever
 import json
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
 
 # Try multiple methods to get the OpenAI API key
 def get_api_key():
@@ -23,195 +40,799 @@ def get_api_key():
                     if api_key:
                         # Set it in environment for current session
                         os.environ['OPENAI_API_KEY'] = api_key
-                        print("OpenAI API key loaded from config file.")
+                        logger.info("OpenAI API key loaded from config file.")
         except Exception as e:
-            print(f"Error reading config file: {e}")
+            logger.error("Error reading config file: %s", e)
     
     return api_key
 
-# Get API key using our robust method
-api_key = get_api_key()
+_llm_provider = None
+_llm_provider_ready = False
+_llm_provider_lock = threading.Lock()
+
+def get_llm_provider():
+    """The completion provider (OpenAI unless LLM_PROVIDER says otherwise), created on first use.
+    
+    Returns None if there is no API key or the provider could not be created.
+    """
+    global _llm_provider, _llm_provider_ready
+    if _llm_provider_ready:
+        return _llm_provider
+    
+    with _llm_provider_lock:
+        if not _llm_provider_ready:
+            try:
+                # Get API key using our robust method
+                _llm_provider = create_llm_provider(get_api_key())
+                if _llm_provider is not None:
+                    logger.info("LLM provider '%s' initialized successfully (model %s).", _llm_provider.name, _llm_provider.model)
+                else:
+                    logger.warning("OpenAI API key not found. Some features may not work. Run 'python verify_openai.py' to set up your API key.")
+            except Exception as e:
+                logger.error("Error initializing LLM provider: %s. Some features may not work properly.", e)
+            _llm_provider_ready = True
+    return _llm_provider
+
+# Rows are re-read from this far before the last sync, in case an edit stamped
+# earlier committed later; re-reading an unchanged row does nothing
+SYNC_OVERLAP = timedelta(seconds=60)
 
-# Initialize OpenAI client
-openai_client = None
-if api_key:
-    try:
-        openai_client = openai.OpenAI(api_key=api_key)
-        print("OpenAI client initialized successfully.")
-    except Exception as e:
-        print(f"ERROR initializing OpenAI client: {e}")
-        print("Some features may not work properly.")
-else:
-    print("WARNING: OpenAI API key not found. Some features may not work.")
-    print("Run 'python verify_openai.py' to set up your API key.")
+def knowledge_state():
+    """(fingerprint, latest updated_at) of the knowledge base from a single aggregate query"""
+    count, id_sum, max_id, last_update = db.session.query(
+        db.func.count(ChatbotKnowledge.id),
+        db.func.coalesce(db.func.sum(ChatbotKnowledge.id), 0),
+        db.func.max(ChatbotKnowledge.id),
+        db.func.max(ChatbotKnowledge.updated_at)
+    ).one()
+    signature = f"{count}:{id_sum}:{max_id}:{last_update}"
+    return hashlib.sha256(signature.encode('utf-8')).hexdigest(), last_update
+
+def knowledge_fingerprint():
+    """Cheap fingerprint of the knowledge base content from a single aggregate query"""
+    return knowledge_state()[0]
 
 class AIModel:
     def __init__(self):
         self.vectorizer = TfidfVectorizer()
         self.knowledge_base = None
         self.vectors = None
+        self.live_rows = None
+        self.row_for_entry = {}
+        self.row_entry_ids = np.zeros(0, dtype=np.int64)
+        self.knowledge_index = KnowledgeIndex()
+        self.retriever = create_retriever()
+        self.response_cache = create_response_cache()
+        self.kb_fingerprint = None
+        # Latest updated_at the model has seen; sync_changes() reads rows edited after it
+        self.synced_at = None
+        self.generation = 0
         self.trained = False
+        
+        # Retrieval-augmented prompting: top-k passages packed under a token budget,
+        # cached by (kb_version, entry ids) so repeat retrievals skip the packing
+        self.rag_top_k = int(os.environ.get('RAG_TOP_K', '4'))
+        self.rag_min_score = float(os.environ.get('RAG_MIN_SCORE', '0.2'))
+        self.rag_token_budget = int(os.environ.get('RAG_TOKEN_BUDGET', '700'))
+        self.context_cache_size = int(os.environ.get('RAG_CONTEXT_CACHE_SIZE', '1024'))
+        self.context_cache = OrderedDict()
+        self.kb_version = 0
+        
+        # Incremental update bookkeeping
+        self.fitted_rows = 0
+        self.pending_changes = 0
+        self.unseen_term_rows = 0
+        self.drift_threshold = float(os.environ.get('MODEL_DRIFT_THRESHOLD', '0.2'))
+        self.unseen_rows_limit = int(os.environ.get('MODEL_UNSEEN_ROWS_LIMIT', '20'))
+        self._rebuild_wanted = False
+        self.compact_interval = float(os.environ.get('MODEL_COMPACT_INTERVAL', '10'))
+        self.reload_interval = float(os.environ.get('MODEL_RELOAD_INTERVAL', '5'))
+        self._last_generation_check = 0
+        self._lock = threading.RLock()
+        # Edits applied since the last swap, as (sequence, entry id, record or None for a
+        # removal); a build replays the ones made after it started so they are not lost
+        self._edits = []
+        self._edit_seq = 0
+        self._compactor = None
+        # Training and artifact reloads triggered from requests run here, never inline
+        self.trainer = create_trainer(self._background_sync)
+    
+    def _fit(self, records, replay_from=None):
+        """Fit a fresh vectorizer and matrix for the given records and swap them in"""
+        vectorizer = TfidfVectorizer()
+        vectors = vectorizer.fit_transform([record.question for record in records])
+        self._install(vectorizer, vectors, records, replay_from=replay_from)
+    
+    def _edit_mark(self):
+        """Sequence number of the latest edit; pass it to _install to replay later edits"""
+        with self._lock:
+            return self._edit_seq
+    
+    def _install(self, vectorizer, vectors, records, row_ids=None, retriever=None, replay_from=None):
+        """Swap in a fitted vectorizer, its matrix and the matching records (a list or a mapped store).
+        
+        Edits made after the replay_from mark were not seen by the build, so
+        they are applied again on top of the new structures.
+        """
+        knowledge_index = KnowledgeIndex.build(records)
+        if row_ids is None:
+            row_ids = [record.id for record in records]
+        
+        # Reuse a persisted retrieval index only if it is the configured backend
+        configured = create_retriever(n_rows=vectors.shape[0])
+        if retriever is None or retriever.name != configured.name:
+            retriever = configured.build(vectors)
+        elif hasattr(configured, 'n_probe'):
+            retriever.n_probe = configured.n_probe
+        
+        knowledge_base = RecordTable(records)
+        live_rows = np.ones(len(records), dtype=bool)
+        row_for_entry = {int(entry_id): row for row, entry_id in enumerate(row_ids)}
+        row_entry_ids = np.asarray(row_ids, dtype=np.int64)
+        
+        # Everything is built above; the swap itself is only reference assignments, so
+        # readers wait microseconds and queries already running keep the old objects
+        with self._lock:
+            self.vectorizer = vectorizer
+            self.vectors = vectors
+            self.retriever = retriever
+            self.knowledge_base = knowledge_base
+            self.live_rows = live_rows
+            self.row_for_entry = row_for_entry
+            self.row_entry_ids = row_entry_ids
+            self.knowledge_index = knowledge_index
+            # Cached query vectors are not comparable across vocabularies
+            self.response_cache.clear()
+            self.kb_version += 1
+            self.context_cache.clear()
+            self.fitted_rows = len(records)
+            self.pending_changes = 0
+            self.unseen_term_rows = 0
+            self.trained = True
+            
+            replay = [] if replay_from is None else [edit for edit in self._edits if edit[0] > replay_from]
+            self._edits = []
+            for _, entry_id, record in replay:
+                if record is None:
+                    self._apply_remove(entry_id)
+                else:
+                    self._apply_add(record)
     
     def train(self):
         """Train the model using the knowledge base from the database"""
+        # Fingerprint first, so concurrent edits make the saved artifact look stale rather than fresh
+        mark = self._edit_mark()
+        fingerprint, updated_at = knowledge_state()
+        
         # Get all knowledge base entries from the database
         knowledge_entries = ChatbotKnowledge.query.all()
         
         if not knowledge_entries:
-            print("No knowledge base entries found for training.")
+            logger.warning("No knowledge base entries found for training.")
+            return False
+        
+        # Keep detached copies so the model never touches expired ORM objects
+        records = [KnowledgeRecord(entry.id, entry.question, entry.answer) for entry in knowledge_entries]
+        
+        # Create TF-IDF vectors and the exact/substring lookup index
+        self._fit(records, replay_from=mark)
+        self.kb_fingerprint = fingerprint
+        self.synced_at = updated_at
+        logger.info("Model trained with %d knowledge base entries.", len(records))
+        return True
+    
+    def save(self):
+        """Write the trained model to a versioned artifact on disk"""
+        if not self.trained or self.kb_fingerprint is None:
+            return False
+        
+        with self._lock:
+            mark = self._edit_seq
+            live = np.flatnonzero(self.live_rows)
+            vectorizer = self.vectorizer
+            vectors = self.vectors[live]
+            records = [self.knowledge_base[row] for row in live]
+            retriever = self.retriever if not self.pending_changes else None
+            fingerprint = self.kb_fingerprint
+            synced_at = self.synced_at
+        
+        # Row numbers shift when tombstones are dropped, so rebuild the index in that case
+        if retriever is None:
+            retriever = create_retriever(n_rows=vectors.shape[0]).build(vectors)
+        
+        try:
+            path = model_store.save_artifact(
+                vectorizer, vectors, records, fingerprint, retriever=retriever,
+                updated_at=synced_at.isoformat() if synced_at else None
+            )
+        except Exception as e:
+            logger.error("Error saving model artifact: %s", e)
+            return False
+        
+        # Switch to the mapped copy so this process shares pages with the other workers
+        self.load(replay_from=mark)
+        logger.info("Model artifact saved to %s", path)
+        return True
+    
+    def load(self, fingerprint=None, replay_from=None):
+        """Load the latest artifact, optionally only if it matches the given KB fingerprint"""
+        if replay_from is None:
+            replay_from = self._edit_mark()
+        path, manifest = model_store.read_manifest()
+        if path is None:
+            return False
+        if fingerprint is not None and manifest['fingerprint'] != fingerprint:
+            logger.info("Model artifact is stale; knowledge base has changed since it was saved.")
             return False
         
-        # Extract questions for training
-        questions = [entry.question for entry in knowledge_entries]
-        self.knowledge_base = knowledge_entries
+        try:
+            vectorizer, vectors, records = model_store.load_artifact(path, manifest)
+        except Exception as e:
+            logger.error("Error loading model artifact: %s", e)
+            return False
+        
+        self._install(
+            vectorizer, vectors, records, row_ids=records.row_ids, retriever=load_retriever(path), replay_from=replay_from
+        )
+        self.kb_fingerprint = manifest['fingerprint']
+        self.synced_at = datetime.fromisoformat(manifest['updated_at']) if manifest.get('updated_at') else None
+        self.generation = manifest['generation']
+        logger.info("Model loaded from %s with %d knowledge base entries.", path, len(records))
+        return True
+    
+    def refresh(self):
+        """Pick up newer artifacts and knowledge base edits from other processes, at most every reload_interval seconds"""
+        now = time.time()
+        if now - self._last_generation_check < self.reload_interval:
+            return False
+        self._last_generation_check = now
+        
+        # Both checks query the database or the disk, so leave them to the background trainer
+        return self.trainer.request()
+    
+    def ensure_trained(self):
+        """Start loading or training in the background if the model is not ready; never blocks.
+        
+        Returns whether the model can answer now. Until it can, retrieval
+        finds nothing and callers use their fallbacks.
+        """
+        if self.trained:
+            self.refresh()
+            return True
+        self.trainer.request()
+        return False
+    
+    def _background_sync(self):
+        """Trainer job: build or load the model as needed, then apply edits made since it was built"""
+        with app.app_context():
+            if not self.trained or self._rebuild_wanted:
+                self._rebuild_wanted = False
+                ok = self.warm_start()
+            elif model_store.current_generation() > self.generation:
+                ok = self.load()
+            else:
+                ok = True
+            
+            # Rows saved by any worker since the build go into the overlay
+            if ok:
+                self.sync_changes()
+            return ok
+    
+    def sync_changes(self):
+        """Apply entries added, edited or deleted in the database since the model was built.
+        
+        The changes go into the incremental overlay, like admin edits made in
+        this process. Returns whether the knowledge base had changed.
+        """
+        fingerprint, updated_at = knowledge_state()
+        if fingerprint == self.kb_fingerprint:
+            return False
+        
+        # Without a sync time (artifacts saved before it was recorded) every row is compared once
+        query = ChatbotKnowledge.query
+        if self.synced_at is not None:
+            query = query.filter(ChatbotKnowledge.updated_at >= self.synced_at - SYNC_OVERLAP)
+        changed = query.all()
+        records = [KnowledgeRecord(entry.id, entry.question, entry.answer) for entry in changed]
+        existing = {entry_id for (entry_id,) in db.session.query(ChatbotKnowledge.id)}
+        with self._lock:
+            for record in records:
+                self._apply_add(record)
+            for entry_id in [entry_id for entry_id in self.row_for_entry if entry_id not in existing]:
+                self._apply_remove(entry_id)
+            self.kb_fingerprint = fingerprint
+            self.synced_at = updated_at
+        
+        self._ensure_compactor()
+        return True
+    
+    def warm_start(self):
+        """Load a saved artifact if it matches the knowledge base, otherwise train and save a new one"""
+        try:
+            if self.load(knowledge_fingerprint()):
+                return True
+        except Exception as e:
+            logger.error("Error checking model artifact: %s", e)
+        
+        if not self.train():
+            return False
+        self.save()
+        return True
+    
+    def add_entry(self, entry):
+        """Append a new knowledge base entry using the current vocabulary"""
+        if not self.trained:
+            return False
+        
+        with self._lock:
+            self._apply_add(KnowledgeRecord(entry.id, entry.question, entry.answer))
         
-        # Create TF-IDF vectors for questions
-        self.vectors = self.vectorizer.fit_transform(questions)
-        self.trained = True
-        print(f"Model trained with {len(questions)} knowledge base entries.")
+        self._ensure_compactor()
         return True
     
+    def update_entry(self, entry):
+        """Replace an edited knowledge base entry (tombstone the old row and append the new one)"""
+        return self.add_entry(entry)
+    
+    def remove_entry(self, entry_id):
+        """Tombstone a deleted knowledge base entry"""
+        if not self.trained:
+            return False
+        
+        with self._lock:
+            if not self._apply_remove(entry_id):
+                return False
+        
+        self._ensure_compactor()
+        return True
+    
+    def _log_edit(self, entry_id, record):
+        self._edit_seq += 1
+        self._edits.append((self._edit_seq, entry_id, record))
+    
+    def _apply_add(self, record):
+        """Append a record to the live structures; the caller holds the lock"""
+        row = self.row_for_entry.get(record.id)
+        if row is not None:
+            current = self.knowledge_base[row]
+            # A replayed edit the new build already contains
+            if (current.question, current.answer) == (record.question, record.answer):
+                return
+            self._tombstone(record.id)
+        
+        row_vector = self.vectorizer.transform([record.question])
+        
+        # Terms outside the fitted vocabulary are invisible until the next compaction
+        analyzer = self.vectorizer.build_analyzer()
+        if any(term not in self.vectorizer.vocabulary_ for term in analyzer(record.question)):
+            self.unseen_term_rows += 1
+        self.vectors = sparse.vstack([self.vectors, row_vector], format='csr')
+        self.live_rows = np.append(self.live_rows, True)
+        self.row_for_entry[record.id] = len(self.knowledge_base)
+        self.row_entry_ids = np.append(self.row_entry_ids, record.id)
+        self.retriever = self.retriever.add(len(self.knowledge_base), row_vector)
+        self.knowledge_base.append(record)
+        self.knowledge_index.add(record.id, record.question)
+        self.response_cache.invalidate_entry(record.id)
+        self.kb_version += 1
+        self.pending_changes += 1
+        self._log_edit(record.id, record)
+    
+    def _apply_remove(self, entry_id):
+        """Tombstone an entry in the live structures; the caller holds the lock"""
+        if entry_id not in self.row_for_entry:
+            return False
+        self._tombstone(entry_id)
+        self.knowledge_index.remove(entry_id)
+        self.response_cache.invalidate_entry(entry_id)
+        self.kb_version += 1
+        self._log_edit(entry_id, None)
+        return True
+    
+    def _tombstone(self, entry_id):
+        # Copy rather than edit in place: a query that already took these references
+        # must keep seeing its snapshot, not a row whose record has become None
+        row = self.row_for_entry.pop(entry_id)
+        live_rows = self.live_rows.copy()
+        live_rows[row] = False
+        knowledge_base = self.knowledge_base.copy()
+        knowledge_base[row] = None
+        self.live_rows = live_rows
+        self.knowledge_base = knowledge_base
+        self.pending_changes += 1
+    
+    def drift(self):
+        """Fraction of rows added, replaced or removed since the last full fit"""
+        if not self.fitted_rows:
+            return 0.0
+        return self.pending_changes / self.fitted_rows
+    
+    def compact(self):
+        """Rebuild in the background once the overlay has drifted far enough from the last full fit.
+        
+        The rebuild refits the vocabulary and IDF, drops the tombstones and
+        publishes a new artifact, or loads one another worker has already
+        published for the same knowledge base. Until then, edits are served
+        from the incremental overlay.
+        """
+        if not self.trained or self.trainer.running:
+            return False
+        if self.drift() < self.drift_threshold and self.unseen_term_rows < self.unseen_rows_limit:
+            return False
+        self._rebuild_wanted = True
+        return self.trainer.request()
+    
+    def _ensure_compactor(self):
+        """Start the background compaction thread on first incremental update"""
+        if self._compactor is not None:
+            return
+        with self._lock:
+            if self._compactor is None:
+                self._compactor = threading.Thread(target=self._compact_loop, name='model-compactor', daemon=True)
+                self._compactor.start()
+    
+    def _compact_loop(self):
+        while True:
+            # Jitter, so of several workers crossing the threshold together one usually
+            # publishes first and the others load its artifact instead of training
+            time.sleep(self.compact_interval * random.uniform(0.5, 1.5))
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error("Error compacting model: %s", e)
+    
+    def lookup_knowledge(self, user_query):
+        """Find an exact or substring match in the knowledge base without querying the database.
+        
+        While the model is still loading, only exact matches are found, through
+        the unique index on the normalized question.
+        """
+        if not self.ensure_trained():
+            return ChatbotKnowledge.query.filter_by(question_normalized=normalize_question(user_query)).first()
+        
+        # The index is safe to read during an edit; only resolving the row needs the lock
+        entry_id = self.knowledge_index.lookup(user_query)
+        if entry_id is None:
+            return None
+        with self._lock:
+            row = self.row_for_entry.get(entry_id)
+            return self.knowledge_base[row] if row is not None else None
+    
+    def search_knowledge(self, text, after=None, limit=50):
+        """Ids of entries whose question contains text, ascending from after (for admin listings).
+        
+        Returns None while the model is still loading.
+        """
+        if not self.ensure_trained():
+            return None
+        
+        return self.knowledge_index.find_all_containing(text, after=after, limit=limit)
+    
     def find_similar_question(self, user_query):
         """Find the most similar question in the knowledge base"""
+        hits = self.retrieve(user_query, k=1, min_score=0.5)
+        if hits:
+            return hits[0]
+        return None, 0
+    
+    def retrieve(self, user_query, k=None, min_score=None):
+        """Return up to k (record, score) pairs scoring above min_score, best first"""
         if not self.trained:
-            return None, 0
+            return []
+        k = self.rag_top_k if k is None else k
+        min_score = self.rag_min_score if min_score is None else min_score
+        
+        with self._lock:
+            vectorizer = self.vectorizer
+            vectors = self.vectors
+            live_rows = self.live_rows
+            knowledge_base = self.knowledge_base
+            retriever = self.retriever
         
-        # Transform user query to vector
-        query_vector = self.vectorizer.transform([user_query])
+        with span('retrieval'):
+            query_vector = vectorizer.transform([user_query])
+            rows, scores = retriever.search(vectors, query_vector, k=k, live_rows=live_rows, min_score=min_score)[0]
+        return [(knowledge_base[row], float(score)) for row, score in zip(rows, scores)]
+    
+    def pack_context(self, hits):
+        """Build the prompt context for retrieved entries; returns (context, entry ids).
         
-        # Calculate similarity scores
-        similarity_scores = cosine_similarity(query_vector, self.vectors)[0]
+        Entries repeating an earlier question or answer are skipped, and
+        passages are added best first until the token budget is spent. The
+        result is cached per knowledge base version and set of entries.
+        """
+        if not hits:
+            return None, None
         
-        # Find the most similar question
-        max_score_index = np.argmax(similarity_scores)
-        max_score = similarity_scores[max_score_index]
+        version = self.kb_version
+        key = (version, tuple(record.id for record, _ in hits))
+        with self._lock:
+            packed = self.context_cache.get(key)
+            if packed is not None:
+                self.context_cache.move_to_end(key)
+        record_cache('rag_context', packed is not None)
+        if packed is not None:
+            return packed
         
-        # Return the most similar knowledge entry and its similarity score
-        if max_score > 0.5:  # Threshold for similarity
-            return self.knowledge_base[max_score_index], max_score
-        return None, 0
+        passages = []
+        entry_ids = []
+        seen = set()
+        used = 0
+        for record, _ in hits:
+            question_key = normalize_question(record.question)
+            answer_key = normalize_question(record.answer)
+            if question_key in seen or answer_key in seen:
+                continue
+            seen.update((question_key, answer_key))
+            
+            passage = f"Question: {record.question}\nAnswer: {record.answer}"
+            cost = estimate_tokens(passage)
+            if used + cost > self.rag_token_budget:
+                continue
+            passages.append(passage)
+            entry_ids.append(record.id)
+            used += cost
+        
+        packed = ('\n\n'.join(passages), tuple(entry_ids)) if passages else (None, None)
+        with self._lock:
+            # Do not cache a result built against a knowledge base that has since changed
+            if version == self.kb_version:
+                self.context_cache[key] = packed
+                while len(self.context_cache) > self.context_cache_size:
+                    self.context_cache.popitem(last=False)
+        return packed
     
-    def get_openai_response(self, user_query, context=None):
-        """Get a response from OpenAI API"""
-        # Check if OpenAI client is initialized
-        if not openai_client:
-            print("ERROR: OpenAI client is not initialized. Cannot generate response.")
+    def _build_messages(self, user_query, context=None, history=None):
+        """Prepare the chat messages sent to the OpenAI API"""
+        messages = [
+            {"role": "system", "content": "You are a helpful university assistant chatbot. Provide concise and accurate information to student queries."}
+        ]
+        
+        # Add context from knowledge base if available
+        if context:
+            messages.append({"role": "system", "content": f"Use these knowledge base entries to answer where they are relevant:\n\n{context}"})
+        
+        # Earlier turns of the conversation, already packed to the token budget
+        if history:
+            messages.extend(history)
+        
+        # Add user query
+        messages.append({"role": "user", "content": user_query})
+        return messages
+    
+    def _openai_error_message(self, error):
+        """Map an OpenAI call failure to a user-facing message"""
+        llm_errors.inc(error=type(error).__name__)
+        if isinstance(error, LLMOverloaded):
+            logger.warning("OpenAI dispatch queue is full, shedding request")
+            return "I'm receiving a lot of questions right now. Please try again in a moment."
+        if isinstance(error, LLMTimeout):
+            logger.warning("OpenAI request timed out: %s", error)
+            return "The AI service is taking too long to respond. Please try again later."
+        
+        error_msg = str(error).lower()
+        logger.error("Error getting OpenAI response: %s", error)
+        
+        if "insufficient_quota" in error_msg or "exceeded your current quota" in error_msg:
+            return "The AI service quota has been exceeded. Please contact an administrator to update the billing plan."
+        elif "authentication" in error_msg:
+            return "I'm having trouble with my AI service authentication. Please ask an administrator to check the OpenAI API key."
+        elif "rate limit" in error_msg:
+            return "I've reached my usage limit. Please try again later or contact an administrator."
+        elif "api" in error_msg:
+            return "The AI service is currently experiencing issues. Please try again later."
+        else:
+            return "I'm having trouble connecting to my knowledge base. Please try again later."
+    
+    def _count_tokens(self, messages, text):
+        """Estimate token usage for providers that do not report it"""
+        llm_tokens.inc(sum(estimate_tokens(message['content']) for message in messages), kind='prompt')
+        llm_tokens.inc(estimate_tokens(text), kind='completion')
+    
+    def _query_vector(self, user_query):
+        """TF-IDF vector for semantic cache lookups, or None if it would not represent the whole query"""
+        if not self.trained:
+            return None
+        vectorizer = self.vectorizer
+        
+        # Out-of-vocabulary words are dropped by the vectorizer, so two different
+        # questions could collapse onto the same vector; only match those exactly
+        analyzer = vectorizer.build_analyzer()
+        if any(term not in vectorizer.vocabulary_ for term in analyzer(user_query)):
+            return None
+        return vectorizer.transform([user_query])
+    
+    def find_similar_batch(self, queries, k=5, min_score=0.0):
+        """Score many queries in one pass through the retrieval backend.
+        
+        Returns one list per query of up to k (entry id, score) pairs, best first,
+        keeping only scores above min_score.
+        """
+        if not self.trained or not queries:
+            return [[] for _ in queries]
+        
+        with self._lock:
+            vectorizer = self.vectorizer
+            vectors = self.vectors
+            live_rows = self.live_rows
+            row_entry_ids = self.row_entry_ids
+            retriever = self.retriever
+        
+        results = retriever.search(vectors, vectorizer.transform(queries), k=k, live_rows=live_rows, min_score=min_score)
+        return [
+            [(int(row_entry_ids[row]), float(score)) for row, score in zip(rows, scores)]
+            for rows, scores in results
+        ]
+    
+    def get_openai_response(self, user_query, context=None, context_id=None, history=None):
+        """Get a response from OpenAI API, reusing cached answers to near-duplicate queries.
+        
+        history is a list of earlier conversation messages; answers that depend
+        on it are neither read from nor stored in the response cache.
+        """
+        # Check if the completion provider is initialized
+        llm_provider = get_llm_provider()
+        if not llm_provider:
+            logger.error("LLM provider is not initialized. Cannot generate response.")
             return "I'm having trouble connecting to my knowledge base. Please ask an administrator to check the OpenAI API key configuration."
-            
+        
+        cache_generation = self.response_cache.generation
+        query_vector = self._query_vector(user_query)
+        cached = None
+        if not history:
+            with span('response_cache'):
+                cached = self.response_cache.get(user_query, query_vector, context_id)
+            record_cache('response', cached is not None)
+        if cached is not None:
+            return cached
+        
+        messages = self._build_messages(user_query, context, history)
         try:
-            # Prepare messages for the API
-            messages = [
-                {"role": "system", "content": "You are a helpful university assistant chatbot. Provide concise and accurate information to student queries."}
-            ]
-            
-            # Add context from knowledge base if available
-            if context:
-                messages.append({"role": "system", "content": f"Use this information to answer: {context}"})
-            
-            # Add user query
-            messages.append({"role": "user", "content": user_query})
-            
-            # Call OpenAI API using the global client
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=150,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content.strip()
+            # Call the provider on the bounded dispatch pool
+            with span('llm_call'):
+                text = llm_dispatcher.call(llm_provider.complete, messages, timeout=llm_dispatcher.timeout)
         except Exception as e:
-            error_msg = str(e).lower()
-            print(f"Error getting OpenAI response: {e}")
-            
-            if "insufficient_quota" in error_msg or "exceeded your current quota" in error_msg:
-                return "The AI service quota has been exceeded. Please contact an administrator to update the billing plan."
-            elif "authentication" in error_msg:
-                return "I'm having trouble with my AI service authentication. Please ask an administrator to check the OpenAI API key."
-            elif "rate limit" in error_msg:
-                return "I've reached my usage limit. Please try again later or contact an administrator."
-            elif "api" in error_msg:
-                return "The AI service is currently experiencing issues. Please try again later."
+            return self._openai_error_message(e)
+        if not llm_provider.reports_usage:
+            self._count_tokens(messages, text)
+        
+        # Only successful standalone completions are cached, never error messages
+        if not history:
+            self.response_cache.put(user_query, query_vector, context_id, text, cache_generation)
+        return text
+    
+    def stream_openai_response(self, user_query, context=None, context_id=None, history=None):
+        """Yield response text from OpenAI API as completion chunks arrive"""
+        llm_provider = get_llm_provider()
+        if not llm_provider:
+            logger.error("LLM provider is not initialized. Cannot generate response.")
+            yield "I'm having trouble connecting to my knowledge base. Please ask an administrator to check the OpenAI API key configuration."
+            return
+        
+        cache_generation = self.response_cache.generation
+        query_vector = self._query_vector(user_query)
+        cached = None
+        if not history:
+            with span('response_cache'):
+                cached = self.response_cache.get(user_query, query_vector, context_id)
+            record_cache('response', cached is not None)
+        if cached is not None:
+            yield cached
+            return
+        
+        messages = self._build_messages(user_query, context, history)
+        try:
+            # The pool bounds connection setup; chunks are read on the caller's thread
+            with span('llm_open_stream'):
+                stream = llm_dispatcher.call(llm_provider.open_stream, messages, timeout=llm_dispatcher.timeout)
+        except Exception as e:
+            yield self._openai_error_message(e)
+            return
+        
+        parts = []
+        try:
+            for text in stream:
+                parts.append(text)
+                yield text
+        except Exception as e:
+            yield "\n" + self._openai_error_message(e)
+            return
+        
+        text = ''.join(parts).strip()
+        # Streamed completions carry no usage block, so count them by estimate
+        self._count_tokens(messages, text)
+        if not history:
+            self.response_cache.put(user_query, query_vector, context_id, text, cache_generation)
+    
+    def stream_response(self, user_query, user_id=None):
+        """Yield (text, source) pairs for the user query, streaming OpenAI output when it is used"""
+        # Until the model is ready, retrieval finds nothing and the LLM or fallback answers
+        self.ensure_trained()
+        
+        hits = self.retrieve(user_query)
+        best_entry, best_score = hits[0] if hits else (None, 0)
+        
+        if best_entry and best_score > 0.7:  # High confidence match
+            yield best_entry.answer, "knowledge_base"
+            return
+        
+        if not get_llm_provider():
+            if best_entry and best_score > 0.5:
+                yield best_entry.answer, "knowledge_base_fallback"
             else:
-                return "I'm having trouble connecting to my knowledge base. Please try again later."
+                yield "I don't have specific information about that in my knowledge base. Please try asking something about university services, policies, or facilities.", "fallback"
+            return
+        
+        # Ground the answer in the top retrieved entries, if any passed the floor
+        context, context_ids = self.pack_context(hits)
+        source = "hybrid" if context else "openai"
+        # Only follow-ups get the earlier turns; standalone questions stay cacheable
+        history = None
+        if is_follow_up(user_query):
+            with span('conversation_pack'):
+                history = conversation_memory.pack(user_id)
+        for text in self.stream_openai_response(user_query, context, context_ids, history):
+            yield text, source
     
-    def get_response(self, user_query, user_id):
+    def get_response(self, user_query, user_id=None):
         """Get a response to the user query using hybrid approach"""
         try:
-            # First try to find a similar question in the knowledge base
-            similar_entry, score = self.find_similar_question(user_query)
+            # Until the model is ready, retrieval finds nothing and the LLM or fallback answers
+            self.ensure_trained()
             
-            # Make sure the model is trained
-            if not self.trained:
-                print("Model not trained. Training now...")
-                self.train()
-                # Try again after training
-                similar_entry, score = self.find_similar_question(user_query)
+            # Top-k knowledge base entries above the retrieval floor, best first
+            hits = self.retrieve(user_query)
+            best_entry, best_score = hits[0] if hits else (None, 0)
             
-            if similar_entry and score > 0.7:  # High confidence match
-                response = similar_entry.answer
+            if best_entry and best_score > 0.7:  # High confidence match
+                response = best_entry.answer
                 source = "knowledge_base"
-                print(f"Found high confidence match ({score:.2f}) in knowledge base for: {user_query}")
-            elif similar_entry and score > 0.5:  # Medium confidence match
-                # Use the knowledge base entry as context for OpenAI
-                context = f"Question: {similar_entry.question}\nAnswer: {similar_entry.answer}"
-                print(f"Found medium confidence match ({score:.2f}) in knowledge base, using as context for: {user_query}")
-                
-                # If OpenAI client is not available, fall back to knowledge base
-                if not openai_client:
-                    response = similar_entry.answer
+                logger.debug("Found high confidence match (%.2f) in knowledge base", best_score, extra={'stage': 'retrieval'})
+            elif not get_llm_provider():
+                # If no LLM provider is configured, fall back to a medium match or a fixed message
+                if best_entry and best_score > 0.5:
+                    response = best_entry.answer
                     source = "knowledge_base_fallback"
-                    print("OpenAI client not available, falling back to knowledge base answer")
+                    logger.debug("LLM provider not available, falling back to knowledge base answer", extra={'stage': 'model_response'})
                 else:
-                    try:
-                        response = self.get_openai_response(user_query, context)
-                        source = "hybrid"
-                    except Exception as e:
-                        print(f"OpenAI error: {e}, falling back to knowledge base")
-                        response = similar_entry.answer
-                        source = "knowledge_base_fallback"
-            else:  # No good match in knowledge base
-                print(f"No good match in knowledge base for: {user_query}")
-                # If OpenAI client is not available, return a fallback message
-                if not openai_client:
                     response = "I don't have specific information about that in my knowledge base. Please try asking something about university services, policies, or facilities."
                     source = "fallback"
-                    print("OpenAI client not available, using fallback message")
-                else:
-                    try:
-                        response = self.get_openai_response(user_query)
-                        source = "openai"
-                    except Exception as e:
-                        print(f"OpenAI error: {e}, using fallback message")
+                    logger.debug("LLM provider not available, using fallback message", extra={'stage': 'model_response'})
+            else:
+                # Use the retrieved entries as context for OpenAI
+                context, context_ids = self.pack_context(hits)
+                source = "hybrid" if context else "openai"
+                logger.debug("Using %d knowledge base entries as context", len(context_ids or ()), extra={'stage': 'context_pack'})
+                try:
+                    # Only follow-ups get the earlier turns; standalone questions stay cacheable
+                    history = None
+                    if is_follow_up(user_query):
+                        with span('conversation_pack'):
+                            history = conversation_memory.pack(user_id)
+                    response = self.get_openai_response(user_query, context, context_ids, history)
+                except Exception as e:
+                    logger.error("OpenAI error: %s", e)
+                    if best_entry and best_score > 0.5:
+                        response = best_entry.answer
+                        source = "knowledge_base_fallback"
+                    else:
                         response = "I don't have specific information about that. Please try asking something about university services, policies, or facilities."
                         source = "fallback"
             
-            # Save chat history
-            try:
-                chat_entry = ChatHistory(
-                    user_id=user_id,
-                    user_message=user_query,
-                    bot_response=response
-                )
-                db.session.add(chat_entry)
-                db.session.commit()
-            except Exception as e:
-                print(f"Error saving chat history: {e}")
-                # Continue even if saving history fails
-            
+            # Chat history is written once per turn by the caller
             return response, source
         except Exception as e:
-            print(f"Error in get_response: {e}")
+            logger.error("Error in get_response: %s", e, exc_info=True)
             return "I'm having trouble processing your request. Please try again later.", "error"
 
 # Create a singleton instance
 ai_model = AIModel()
 
 def initialize_model():
-    """Initialize and train the AI model"""
-    success = ai_model.train()
+    """Initialize the AI model from a saved artifact, training only if the knowledge base changed"""
+    success = ai_model.warm_start()
     if success:
-        print("AI model successfully trained and initialized.")
+        logger.info("AI model successfully trained and initialized.")
     else:
-        print("WARNING: AI model training failed. Chatbot may not work properly.")
+        logger.warning("AI model training failed. Chatbot may not work properly.")
     return success
\ No newline at end of file
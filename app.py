@@ -7,6 +7,11 @@ from flask_wtf.csrf import CSRFProtect
 import os
 import pymysql
 from datetime import datetime
+from db_pool import engine_options
+from log_config import configure_logging
+
+# Queue-based logging configured from LOG_LEVEL, LOG_FORMAT and LOG_SAMPLE_RATES
+configure_logging()
 
 # Configure PyMySQL to be used with SQLAlchemy
 pymysql.install_as_MySQLdb()
@@ -22,30 +27,54 @@ db_password = os.environ.get('DB_PASSWORD', '')
 db_host = os.environ.get('DB_HOST', 'localhost')
 db_name = os.environ.get('DB_NAME', 'university_chatbot')
 
-# MySQL connection string
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql://{db_user}:{db_password}@{db_host}/{db_name}'
+# MySQL connection string; DATABASE_URL overrides it (e.g. a SQLite file for benchmarks)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'mysql://{db_user}:{db_password}@{db_host}/{db_name}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Connection pool sizing, recycling and pre-ping (see db_pool.py)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
+
 # Initialize extensions
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
-# Import routes after app initialization to avoid circular imports
-from routes import *
+# Import routes after app initialization to avoid circular imports. They load the
+# AI model on first use, so importing them here keeps `import app` cheap and lets
+# `flask --app app` and `gunicorn app:app` find a fully routed app
+import routes
+
+def create_app(preload_model=None):
+    """Return the app, ready to serve.
 
-# Ensure database tables are created
-with app.app_context():
+    Importing this module stays cheap: it opens no database connection and
+    does not load the AI model, so CLI scripts that only need `app` and `db`
+    start quickly. With preload_model (default: the PRELOAD_MODEL setting)
+    the model is loaded or trained here, so a pre-forking server that
+    imports the app before forking (gunicorn --preload) does it once and
+    the workers share the copy.
+    """
+    if preload_model is None:
+        preload_model = os.environ.get('PRELOAD_MODEL', 'false').lower() in ('1', 'true', 'yes')
+    if preload_model:
+        from ai_model import initialize_model
+        with app.app_context():
+            initialize_model()
+            # Forked workers must open their own connections, not share the preloading one
+            db.engine.dispose()
+    return app
+
+@app.cli.command('init-db')
+def init_db():
+    """Create missing tables and apply schema revisions."""
+    # Importing migrate_db also imports models, which registers the tables
+    from migrate_db import migrate
     db.create_all()
     print("Database tables created or verified.")
+    if not migrate():
+        raise SystemExit(1)
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        # Import and initialize AI model
-        from ai_model import initialize_model
-        print("Training AI model...")
-        initialize_model()
-        print("AI model training complete.")
-    app.run(debug=True)
-    
\ No newline at end of file
+    # Import by module name so the model is loaded for the same app object the routes use
+    from app import create_app
+    create_app(preload_model=True).run(debug=True)
@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from benchmark_retrieval import synthetic_questions, perturb
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def latency_summary(latencies, elapsed):
+    """Throughput and p50/p95/p99 latency for a list of per-call durations in seconds"""
+    millis = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(millis, [50, 95, 99])
+    return {
+        'calls': len(latencies),
+        'throughput_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+def seed_knowledge(db, size, seed, chunk_size=1000):
+    """Replace the knowledge base and chat history with size synthetic entries"""
+    from models import ChatbotKnowledge, ChatHistory
+    from knowledge_index import normalize_question
+
+    db.session.query(ChatHistory).delete()
+    db.session.query(ChatbotKnowledge).delete()
+    db.session.commit()
+
+    questions = []
+    seen = set()
+    chunk = []
+    # Ask for a few extra so duplicates can be dropped and still reach size
+    for question in synthetic_questions(int(size * 1.2) + 10, seed=seed):
+        key = normalize_question(question)
+        if key in seen:
+            continue
+        seen.add(key)
+        questions.append(question)
+        chunk.append({'question': question, 'question_normalized': key, 'answer': f"Synthetic answer for: {question}"})
+        if len(chunk) >= chunk_size:
+            db.session.execute(ChatbotKnowledge.__table__.insert(), chunk)
+            chunk.clear()
+        if len(questions) == size:
+            break
+    if chunk:
+        db.session.execute(ChatbotKnowledge.__table__.insert(), chunk)
+    db.session.commit()
+    return questions
+
+def ensure_users(db, count):
+    """Ids of count benchmark users, created on first use"""
+    from models import User
+    from werkzeug.security import generate_password_hash
+
+    ids = []
+    for i in range(count):
+        email = f"bench{i}@example.com"
+        user = User.query.filter_by(email=email).first()
+        if user is None:
+            user = User(username=f"bench{i}", email=email, password=generate_password_hash('benchmark'))
+            db.session.add(user)
+            db.session.commit()
+        ids.append(user.id)
+    return ids
+
+def chat_queries(questions, count, seed):
+    """Mix of rephrased FAQ questions, questions blending two entries, and off-topic questions.
+
+    Rephrasings mostly match one entry closely (answered from the knowledge
+    base), blends score in between (sent to the LLM with context), and
+    off-topic questions go to the LLM alone.
+    """
+    rng = np.random.default_rng(seed)
+    rephrased = perturb(questions, count, seed=seed)
+    queries = []
+    for query in rephrased:
+        draw = rng.random()
+        if draw < 0.6:
+            queries.append(query)
+        elif draw < 0.8:
+            first, second = (questions[i].split() for i in rng.choice(len(questions), size=2))
+            queries.append(' '.join(first[:len(first) // 2 + 1] + second[len(second) // 2:]))
+        else:
+            queries.append(f"tell me something about topic {rng.integers(1_000_000)}")
+    return queries
+
+def csrf_credentials(app):
+    """(header token, session value) like the chat page gives the browser.
+
+    Call outside an app context: generate_csrf caches the token on g.
+    """
+    from flask import session
+    from flask_wtf.csrf import generate_csrf
+
+    with app.test_request_context():
+        return generate_csrf(), session['csrf_token']
+
+def bench_chat(app, user_ids, queries, concurrency, csrf):
+    """POST each query to /chat_api through the Flask test client, spread over the users"""
+    token, raw_token = csrf
+    clients = []
+    for user_id in user_ids:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+            session['csrf_token'] = raw_token
+        clients.append((client, token))
+
+    def send(index):
+        client, token = clients[index % len(clients)]
+        start = time.perf_counter()
+        response = client.post('/chat_api', json={'message': queries[index]}, headers={'X-CSRFToken': token})
+        elapsed = time.perf_counter() - start
+        source = response.get_json().get('source') if response.status_code == 200 else f"http_{response.status_code}"
+        return elapsed, source
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        # One client per user, so each worker thread uses a different user in turn
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(send, range(len(queries))))
+    else:
+        results = [send(i) for i in range(len(queries))]
+    elapsed = time.perf_counter() - start
+
+    summary = latency_summary([latency for latency, _ in results], elapsed)
+    sources = {}
+    for _, source in results:
+        sources[source] = sources.get(source, 0) + 1
+    summary['concurrency'] = concurrency
+    summary['sources'] = dict(sorted(sources.items()))
+    return summary
+
+def run(sizes, queries, requests, users, concurrency, seed):
+    # Imported here so main() can set up the environment before the app is configured
+    from app import create_app, db
+    from ai_model import ai_model
+    from history_writer import history_writer
+    from conversation_memory import conversation_memory
+
+    app = create_app()
+    csrf = csrf_credentials(app)
+    report = []
+    with app.app_context():
+        db.create_all()
+        user_ids = ensure_users(db, users)
+        for size in sizes:
+            start = time.perf_counter()
+            questions = seed_knowledge(db, size, seed)
+            entry = {'rows': len(questions), 'seed_seconds': round(time.perf_counter() - start, 3)}
+
+            start = time.perf_counter()
+            if not ai_model.train():
+                raise RuntimeError("Training failed on the synthetic knowledge base")
+            entry['train'] = {'seconds': round(time.perf_counter() - start, 3), 'peak_rss_mb': peak_rss_mb()}
+
+            lookups = perturb(questions, queries, seed=seed + 1)
+            latencies = []
+            start = time.perf_counter()
+            for query in lookups:
+                call_start = time.perf_counter()
+                ai_model.find_similar_question(query)
+                latencies.append(time.perf_counter() - call_start)
+            entry['find_similar_question'] = latency_summary(latencies, time.perf_counter() - start)
+
+            for user_id in user_ids:
+                conversation_memory.forget(user_id)
+            entry['chat_api'] = bench_chat(app, user_ids, chat_queries(questions, requests, seed + 2), concurrency, csrf)
+            history_writer.flush()
+
+            report.append(entry)
+            print(f"{size} rows done", file=sys.stderr)
+        # Finish the background history writes before the scratch database goes away
+        history_writer.close()
+    return report
+
+def compare(baseline, report, tolerance):
+    """Describe every metric in report that is more than tolerance worse than in baseline"""
+    previous = {entry['rows']: entry for entry in baseline.get('results', [])}
+    regressions = []
+    for entry in report['results']:
+        old = previous.get(entry['rows'])
+        if old is None:
+            continue
+        checks = [('train.seconds', old['train']['seconds'], entry['train']['seconds'], True)]
+        for stage in ('find_similar_question', 'chat_api'):
+            checks.append((f'{stage}.p95_ms', old[stage]['p95_ms'], entry[stage]['p95_ms'], True))
+            checks.append((
+                f'{stage}.throughput_per_second',
+                old[stage]['throughput_per_second'], entry[stage]['throughput_per_second'], False
+            ))
+        for name, before, after, lower_is_better in checks:
+            if not before:
+                continue
+            change = (after - before) / before
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append(f"{entry['rows']} rows: {name} {before} -> {after} ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark training, similarity search and /chat_api end to end against a fake LLM",
+        epilog="--database-url is wiped and reseeded for each size; only point it at a scratch database."
+    )
+    parser.add_argument('--sizes', default='1000,10000,100000', help="comma-separated knowledge base sizes")
+    parser.add_argument('--queries', type=int, default=500, help="find_similar_question calls per size")
+    parser.add_argument('--requests', type=int, default=200, help="/chat_api requests per size")
+    parser.add_argument('--users', type=int, default=10, help="users the chat requests are spread over")
+    parser.add_argument('--concurrency', type=int, default=1, help="threads sending chat requests")
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="seconds the fake LLM sleeps per call")
+    parser.add_argument('--database-url', help="scratch database (default: a temporary SQLite file)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON report here as well as to stdout")
+    parser.add_argument('--compare', help="baseline report; exit with status 1 if a metric regressed")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative regression (default 0.2)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='chatbot-bench-')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    settings = {
+        'DATABASE_URL': database_url,
+        'LLM_PROVIDER': 'fake',
+        'FAKE_LLM_LATENCY': str(args.llm_latency),
+        'FAKE_LLM_JITTER': '0',
+        'FAKE_LLM_FAILURE_RATE': '0',
+        'FAKE_LLM_SEED': str(args.seed),
+        'MODEL_ARTIFACT_DIR': os.path.join(workdir, 'artifacts')
+    }
+    os.environ.update(settings)
+    # Keep per-request log lines out of the measurements unless asked for
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    try:
+        # The app prints setup messages; keep stdout for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run(
+                sizes=[int(size) for size in args.sizes.split(',')],
+                queries=args.queries,
+                requests=args.requests,
+                users=args.users,
+                concurrency=args.concurrency,
+                seed=args.seed
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': database_url.split(':', 1)[0],
+        'settings': {
+            'queries': args.queries, 'requests': args.requests, 'users': args.users,
+            'concurrency': args.concurrency, 'llm_latency': args.llm_latency, 'seed': args.seed
+        },
+        'results': results
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != report['settings']:
+            print("WARNING: baseline was run with different settings; results may not be comparable", file=sys.stderr)
+        regressions = compare(baseline, report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from retrieval import BruteForceRetriever, InvertedRetriever, IVFRetriever
+
+def synthetic_questions(n, seed=0, topics=200, vocabulary=5000):
+    """Generate n FAQ-like questions drawn from topic-specific word distributions"""
+    rng = np.random.default_rng(seed)
+    words = [f"w{i}" for i in range(vocabulary)]
+    openers = ['how do i', 'where is the', 'when does the', 'what is the', 'can i', 'who handles the']
+
+    # Each topic favours its own slice of the vocabulary, with Zipf-like weights
+    topic_words = [rng.choice(vocabulary, size=60, replace=False) for _ in range(topics)]
+    weights = 1.0 / np.arange(1, 61)
+    weights /= weights.sum()
+
+    questions = []
+    for _ in range(n):
+        topic = topic_words[rng.integers(topics)]
+        length = rng.integers(4, 10)
+        body = ' '.join(words[w] for w in rng.choice(topic, size=length, p=weights))
+        questions.append(f"{openers[rng.integers(len(openers))]} {body}")
+    return questions
+
+def perturb(questions, count, seed=1):
+    """Sample questions, drop a word and misspell another, like a student retyping an FAQ.
+
+    TF-IDF ignores word order, so both edits change the query vector: the
+    dropped word loses its weight and the typo turns a word into a term
+    outside the vocabulary.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for index in rng.choice(len(questions), size=count):
+        tokens = questions[index].split()
+        if len(tokens) > 4:
+            del tokens[rng.integers(2, len(tokens))]
+        # Replace one letter of a word, keeping the first two words intact
+        if len(tokens) > 2:
+            i = rng.integers(2, len(tokens))
+            word = tokens[i]
+            position = rng.integers(len(word))
+            tokens[i] = word[:position] + chr(ord('a') + rng.integers(26)) + word[position + 1:]
+        queries.append(' '.join(tokens))
+    return queries
+
+def timed_search(retriever, vectors, query_vectors, k):
+    """Search one query at a time, like the chat path, and return (results, queries per second)"""
+    start = time.perf_counter()
+    results = [retriever.search(vectors, query_vectors[i], k=k)[0] for i in range(query_vectors.shape[0])]
+    return results, query_vectors.shape[0] / (time.perf_counter() - start)
+
+def timed_batch(retriever, vectors, query_vectors, k):
+    """Search all queries in one call and return queries per second"""
+    start = time.perf_counter()
+    retriever.search(vectors, query_vectors, k=k)
+    return query_vectors.shape[0] / (time.perf_counter() - start)
+
+def timed_build(retriever, vectors):
+    start = time.perf_counter()
+    retriever.build(vectors)
+    return round(time.perf_counter() - start, 3)
+
+def recall_at_k(reference, results):
+    """Fraction of the exact top-k rows that the approximate search also returned"""
+    hits = total = 0
+    for (ref_rows, _), (rows, _) in zip(reference, results):
+        total += len(ref_rows)
+        hits += len(set(ref_rows.tolist()) & set(rows.tolist()))
+    return hits / total if total else 1.0
+
+def run(sizes, queries, k, probes, seed):
+    report = []
+    for size in sizes:
+        questions = synthetic_questions(size, seed=seed)
+        vectorizer = TfidfVectorizer()
+        vectors = vectorizer.fit_transform(questions)
+        query_vectors = vectorizer.transform(perturb(questions, queries, seed=seed + 1))
+
+        brute_force = BruteForceRetriever()
+        exact, qps = timed_search(brute_force, vectors, query_vectors, k)
+        entry = {
+            'rows': size,
+            'queries': queries,
+            'k': k,
+            'brute_force': {
+                'qps': round(qps, 1),
+                'batch_qps': round(timed_batch(brute_force, vectors, query_vectors, k), 1)
+            }
+        }
+
+        inverted = InvertedRetriever()
+        build_seconds = timed_build(inverted, vectors)
+        results, qps = timed_search(inverted, vectors, query_vectors, k)
+        entry['inverted'] = {
+            'build_seconds': build_seconds,
+            'qps': round(qps, 1),
+            'batch_qps': round(timed_batch(inverted, vectors, query_vectors, k), 1),
+            f'recall_at_{k}': round(recall_at_k(exact, results), 4)
+        }
+
+        ivf = IVFRetriever()
+        build_seconds = timed_build(ivf, vectors)
+        entry['ivf'] = []
+        for n_probe in probes:
+            ivf.n_probe = n_probe
+            results, qps = timed_search(ivf, vectors, query_vectors, k)
+            entry['ivf'].append({
+                'n_lists': len(ivf.list_rows),
+                'n_probe': n_probe,
+                'build_seconds': build_seconds,
+                'qps': round(qps, 1),
+                f'recall_at_{k}': round(recall_at_k(exact, results), 4)
+            })
+        report.append(entry)
+        print(f"{size} rows done", file=sys.stderr)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recall@k and QPS of the retrieval backends against brute force")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="comma-separated knowledge base sizes")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('-k', type=int, default=5)
+    parser.add_argument('--probes', default='1,4,8,16,32', help="comma-separated n_probe values to try")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(
+        sizes=[int(size) for size in args.sizes.split(',')],
+        queries=args.queries,
+        k=args.k,
+        probes=[int(probe) for probe in args.probes.split(',')],
+        seed=args.seed
+    )
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import sys
+import app  # conversation_memory imports from app, so load it first
+from conversation_memory import is_follow_up
+
+# (message, expected) pairs; the standalone ones used to be misread as follow-ups
+CASES = [
+    ("Is there a gym on campus?", False),
+    ("Is this semester's timetable online yet?", False),
+    ("What is that building next to the library?", False),
+    ("Software licences for students: where do I get them cheaply?", True),
+    ("Software licences for students, where do I get one?", False),
+    ("Andrew building opening hours on weekends", False),
+    ("Thenceforth which rules apply to resits?", False),
+    ("Why is the library closed on Sunday?", False),
+    ("How do I apply for accommodation?", False),
+    ("and on weekends?", True),
+    ("What about the fees for international students?", True),
+    ("How about postgraduate students then?", True),
+    ("So do I need to register first?", True),
+    ("Can I pay it in instalments?", True),
+    ("When do those close?", True),
+    ("why?", True),
+]
+
+def main():
+    failed = 0
+    for message, expected in CASES:
+        result = is_follow_up(message)
+        if result != expected:
+            failed += 1
+            print(f"FAIL {message!r}: expected {expected}, got {result}")
+    print(f"{len(CASES) - failed}/{len(CASES)} follow-up cases passed")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
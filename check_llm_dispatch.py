@@ -0,0 +1,114 @@
+import sys
+import time
+import argparse
+import threading
+from llm_dispatch import LLMDispatcher, LLMOverloaded, LLMTimeout
+from llm_provider import OpenAIProvider
+from fake_openai_server import start_fake_server
+
+MESSAGES = [{"role": "user", "content": "When does the library open?"}]
+
+def make_provider(base_url, timeout):
+    # The OpenAI SDK is slow to import, so only load it when it is used
+    import openai
+    client = openai.OpenAI(api_key='fake-key', base_url=base_url, max_retries=0)
+    return OpenAIProvider(client, model='fake', timeout=timeout)
+
+def check_timeout(provider, latency):
+    """A call slower than the dispatch timeout raises LLMTimeout without waiting for the reply"""
+    dispatcher = LLMDispatcher(max_workers=2, max_queue=0, timeout=latency / 4)
+    start = time.perf_counter()
+    try:
+        dispatcher.call(provider.complete, MESSAGES)
+    except LLMTimeout:
+        elapsed = time.perf_counter() - start
+        return elapsed < latency / 2, f"timed out after {elapsed:.2f}s (server latency {latency}s)"
+    finally:
+        dispatcher.shutdown(wait=False)
+    return False, "call finished instead of timing out"
+
+def check_abandoned_calls_shed(provider, latency):
+    """Timed-out calls keep their slots until they finish, so the next call is shed at once.
+
+    This is the case the gunicorn settings are sized for: LLM_MAX_CONCURRENCY
+    equal to the request threads and no queue.
+    """
+    dispatcher = LLMDispatcher(max_workers=2, max_queue=0, timeout=latency / 4)
+    try:
+        for _ in range(2):
+            try:
+                dispatcher.call(provider.complete, MESSAGES)
+            except LLMTimeout:
+                pass
+        start = time.perf_counter()
+        try:
+            dispatcher.call(provider.complete, MESSAGES)
+        except LLMOverloaded:
+            elapsed = time.perf_counter() - start
+            shed = elapsed < 0.05
+        else:
+            return False, "call was accepted while both slots were held by abandoned calls"
+
+        # Once the abandoned calls finish, their slots are free again
+        time.sleep(latency)
+        reply = dispatcher.call(provider.complete, MESSAGES, timeout=latency * 4)
+        return shed and bool(reply), f"shed in {elapsed * 1000:.1f}ms, then recovered: {reply[:40]!r}"
+    finally:
+        dispatcher.shutdown(wait=False)
+
+def check_burst(provider, latency, burst):
+    """A burst larger than workers plus queue is answered up to the limit and the rest is shed"""
+    dispatcher = LLMDispatcher(max_workers=2, max_queue=2, timeout=latency * 10)
+    results = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(burst)
+
+    def send():
+        barrier.wait()
+        try:
+            dispatcher.call(provider.complete, MESSAGES)
+            outcome = 'ok'
+        except LLMOverloaded:
+            outcome = 'shed'
+        except LLMTimeout:
+            outcome = 'timeout'
+        with lock:
+            results.append(outcome)
+
+    threads = [threading.Thread(target=send) for _ in range(burst)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    dispatcher.shutdown()
+
+    counts = {outcome: results.count(outcome) for outcome in sorted(set(results))}
+    expected = {'ok': 4, 'shed': burst - 4}
+    return counts == expected, f"{burst} concurrent calls: {counts} (expected {expected})"
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check LLM dispatch timeouts and load shedding against fake_openai_server.py"
+    )
+    parser.add_argument('--latency', type=float, default=0.4, help="seconds the fake server takes per reply")
+    parser.add_argument('--burst', type=int, default=8, help="concurrent calls in the burst check")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(latency=args.latency)
+    provider = make_provider(base_url, timeout=args.latency * 10)
+    failed = False
+    try:
+        for name, check in (
+            ('timeout', lambda: check_timeout(provider, args.latency)),
+            ('abandoned calls shed', lambda: check_abandoned_calls_shed(provider, args.latency)),
+            ('burst', lambda: check_burst(provider, args.latency, args.burst))
+        ):
+            ok, detail = check()
+            failed = failed or not ok
+            print(f"{'PASS' if ok else 'FAIL'} {name}: {detail}")
+    finally:
+        server.shutdown()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
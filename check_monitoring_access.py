@@ -0,0 +1,30 @@
+import os
+import sys
+from app import app
+
+TOKEN = 'check-monitoring-token'
+
+# (description, Authorization header, expected status)
+CASES = [
+    ("no token", None, 403),
+    ("wrong token", "Bearer not-the-token", 403),
+    ("non-ASCII token", "Bearer jeton-sécurisé", 403),
+    ("correct token", f"Bearer {TOKEN}", 200)
+]
+
+def main():
+    os.environ['MONITORING_TOKEN'] = TOKEN
+    os.environ.pop('MONITORING_ALLOW_LOCALHOST', None)
+    client = app.test_client()
+    failed = False
+    for path in ('/internal/stats', '/metrics'):
+        for name, authorization, expected in CASES:
+            headers = {'Authorization': authorization} if authorization else {}
+            status = client.get(path, headers=headers).status_code
+            ok = status == expected
+            failed = failed or not ok
+            print(f"{'PASS' if ok else 'FAIL'} {path} {name}: {status} (expected {expected})")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from app import db
+from models import ChatHistory
+
+# Turns with these sources carry no useful context for the model
+SKIPPED_SOURCES = ('error', 'busy')
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)"""
+    return len(text) // 4 + 1
+
+# Words that point back at an earlier turn ("what about its fees?", "and for them?").
+# Generic words such as "there" or "this" also start standalone questions, so they are left out
+FOLLOW_UP_WORDS = frozenset((
+    'it', 'its', 'they', 'them', 'their', 'these', 'those', 'he', 'she', 'him', 'her', 'his', 'else'
+))
+# Matched against the leading whole words only
+FOLLOW_UP_OPENERS = (('and',), ('but',), ('so',), ('then',), ('also',), ('what', 'about'), ('how', 'about'))
+
+def is_follow_up(message):
+    """Whether the message probably needs the earlier turns to be understood.
+
+    Standalone questions are answered without history, so their answers can
+    be shared through the response cache.
+    """
+    words = re.findall(r"[a-z']+", message.lower())
+    if len(words) <= 3:
+        return True
+    if any(tuple(words[:len(opener)]) == opener for opener in FOLLOW_UP_OPENERS):
+        return True
+    return any(word in FOLLOW_UP_WORDS for word in words)
+
+class ConversationMemory:
+    """Recent chat turns per user, packed into prompts under a token budget.
+
+    Each user gets a ring buffer of the last max_turns turns in this process.
+    It is filled from ChatHistory with one indexed query the first time the
+    user is seen here, and after that from the turns this process answers,
+    so building a prompt never touches the database. Users are evicted least
+    recently used beyond max_users. With several workers, each keeps its own
+    buffers, so a user moving between workers may miss a turn or two.
+    """
+
+    def __init__(self, max_turns=10, token_budget=600, max_users=10000):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.max_users = max_users
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def append(self, user_id, user_message, bot_response, source=None):
+        """Remember a finished turn; call before the turn is queued for ChatHistory"""
+        if user_id is None or source in SKIPPED_SOURCES or not bot_response:
+            return
+        # Seed first so the buffer holds the earlier turns as well
+        self.recent(user_id)
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is not None:
+                buffer.append((user_message, bot_response))
+
+    def recent(self, user_id):
+        """Remembered (user_message, bot_response) turns for the user, oldest first"""
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is not None:
+                self._buffers.move_to_end(user_id)
+                return list(buffer)
+
+        rows = db.session.query(ChatHistory.user_message, ChatHistory.bot_response, ChatHistory.source).filter(
+            ChatHistory.user_id == user_id
+        ).order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(self.max_turns).all()
+        turns = [(row.user_message, row.bot_response) for row in reversed(rows) if row.source not in SKIPPED_SOURCES]
+
+        with self._lock:
+            buffer = self._buffers.setdefault(user_id, deque(turns, maxlen=self.max_turns))
+            self._buffers.move_to_end(user_id)
+            while len(self._buffers) > self.max_users:
+                self._buffers.popitem(last=False)
+            return list(buffer)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._buffers.pop(user_id, None)
+
+    def pack(self, user_id, token_budget=None):
+        """Chat messages for the user's recent turns that fit in the token budget.
+
+        The newest turns are kept whole. Older turns that do not fit are
+        reduced to a one-line summary of the questions asked, if that fits,
+        and dropped otherwise.
+        """
+        if user_id is None:
+            return []
+        budget = self.token_budget if token_budget is None else token_budget
+
+        turns = self.recent(user_id)
+        kept = []
+        used = 0
+        for user_message, bot_response in reversed(turns):
+            cost = estimate_tokens(user_message) + estimate_tokens(bot_response) + 8
+            if used + cost > budget:
+                break
+            kept.append((user_message, bot_response))
+            used += cost
+        kept.reverse()
+
+        messages = []
+        dropped = turns[:len(turns) - len(kept)]
+        if dropped:
+            questions = '; '.join(user_message[:80] for user_message, _ in dropped)
+            summary = f"Earlier in this conversation the user asked about: {questions}"
+            if used + estimate_tokens(summary) + 4 <= budget:
+                messages.append({"role": "system", "content": summary})
+
+        for user_message, bot_response in kept:
+            messages.append({"role": "user", "content": user_message})
+            messages.append({"role": "assistant", "content": bot_response})
+        return messages
+
+# Shared memory, configured from the environment
+conversation_memory = ConversationMemory(
+    max_turns=int(os.environ.get('CONVERSATION_MAX_TURNS', '10')),
+    token_budget=int(os.environ.get('CONVERSATION_TOKEN_BUDGET', '600')),
+    max_users=int(os.environ.get('CONVERSATION_MAX_USERS', '10000'))
+)
@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+class PoolSaturated(exc.TimeoutError):
+    """Raised when every connection is in use and too many requests are already waiting"""
+
+class PoolStats:
+    """Process-wide counters for the database connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.waiting = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.shed = 0
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def begin_wait(self, max_waiters):
+        """Register a waiting checkout, or return False if max_waiters are already queued"""
+        with self._lock:
+            if self.waiting >= max_waiters:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            self.waits += 1
+            return True
+
+    def end_wait(self, seconds):
+        with self._lock:
+            self.waiting -= 1
+            self.wait_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'waiting': self.waiting,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 3),
+                'timeouts': self.timeouts,
+                'shed': self.shed
+            }
+
+pool_stats = PoolStats()
+
+class MonitoredQueuePool(QueuePool):
+    """QueuePool that counts waits and sheds checkouts when the pool is saturated.
+
+    A checkout that finds no idle connection and no overflow left normally
+    blocks for pool_timeout. Here at most max_waiters requests may block;
+    any more fail at once with PoolSaturated so the caller can answer 503
+    instead of tying up a worker thread.
+    """
+
+    max_waiters = int(os.environ.get('DB_POOL_MAX_WAITERS', '10'))
+
+    def _do_get(self):
+        saturated = self._max_overflow > -1 and self._overflow >= self._max_overflow and self._pool.empty()
+        if not saturated:
+            return super()._do_get()
+
+        if not pool_stats.begin_wait(self.max_waiters):
+            raise PoolSaturated(
+                f"Connection pool saturated: {self.checkedout()} connections in use "
+                f"and {self.max_waiters} requests already waiting"
+            )
+        start = time.monotonic()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.increment('timeouts')
+            raise
+        finally:
+            pool_stats.end_wait(time.monotonic() - start)
+
+@event.listens_for(MonitoredQueuePool, 'checkout')
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats.increment('checkouts')
+
+@event.listens_for(MonitoredQueuePool, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    pool_stats.increment('connects')
+
+@event.listens_for(MonitoredQueuePool, 'invalidate')
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    # Stale connections dropped by pre-ping or by a disconnect error
+    pool_stats.increment('invalidations')
+
+def engine_options():
+    """SQLAlchemy engine options from the DB_POOL_* environment variables.
+
+    pool_recycle should stay below the server's wait_timeout so idle
+    connections are replaced before MySQL closes them; pre-ping catches
+    the ones that were closed anyway.
+    """
+    return {
+        'poolclass': MonitoredQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '20')),
+        # Whole seconds: Flask-SQLAlchemy's engine_from_config coerces this to int
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', '5')),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    }
+
+def pool_status(engine):
+    """Current pool gauges plus the process-wide counters"""
+    pool = engine.pool
+    status = {'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'timeout': pool.timeout()
+        })
+    status.update(pool_stats.snapshot())
+    return status
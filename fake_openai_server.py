@@ -0,0 +1,119 @@
+import json
+import sys
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI chat completions endpoint.
+# Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8099/v1 and any OPENAI_API_KEY.
+
+class FakeCompletionHandler(BaseHTTPRequestHandler):
+    latency = 0.5
+    failure_rate = 0.0
+    random = random.Random(0)
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        messages = body.get('messages', [])
+        prompt = messages[-1]['content'] if messages else ''
+        reply = f"This is a placeholder answer to: {prompt}"
+
+        if self.random.random() < self.failure_rate:
+            time.sleep(self.latency)
+            self._send_json(500, {'error': {'message': 'Simulated server error', 'type': 'server_error'}})
+            return
+
+        if body.get('stream'):
+            self._stream(body, reply)
+        else:
+            time.sleep(self.latency)
+            self._send_json(200, {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'fake'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': reply},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {
+                    'prompt_tokens': len(prompt.split()),
+                    'completion_tokens': len(reply.split()),
+                    'total_tokens': len(prompt.split()) + len(reply.split())
+                }
+            })
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, body, reply):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        words = reply.split(' ')
+        delay = self.latency / max(len(words), 1)
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            chunk = {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'fake'),
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': word if i == 0 else ' ' + word},
+                    'finish_reason': None
+                }]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+def start_fake_server(host='127.0.0.1', port=0, latency=0.5, failure_rate=0.0, seed=0):
+    """Start the fake server on a background thread and return (server, base_url).
+
+    A failure_rate fraction of requests get an HTTP 500, drawn from a
+    generator seeded with seed.
+    """
+    handler = type('Handler', (FakeCompletionHandler,), {
+        'latency': latency,
+        'failure_rate': failure_rate,
+        'random': random.Random(seed)
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    failure_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    server, base_url = start_fake_server(port=port, latency=latency, failure_rate=failure_rate)
+    print(f"Fake completion server listening on {base_url} (latency {latency}s, failure rate {failure_rate})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,60 @@
+from app import db
+from models import Feedback, FeedbackRollup
+from pagination import keyset_page
+
+RATINGS = range(1, 6)
+
+def record_rating(rating, amount=1):
+    """Adjust the rollup for one rating in the caller's transaction (commit happens there).
+
+    Only existing rows are updated. Until rebuild_rollup() has created all
+    five, the rollup is incomplete and rating_summary() does not use it.
+    """
+    table = FeedbackRollup.__table__
+    db.session.execute(
+        table.update().where(table.c.rating == rating).values(count=table.c.count + amount)
+    )
+
+def remove_user_feedback(user_id):
+    """Delete a user's feedback and take it out of the rollup"""
+    counts = db.session.query(Feedback.rating, db.func.count(Feedback.id)).filter(
+        Feedback.user_id == user_id
+    ).group_by(Feedback.rating).all()
+    for rating, count in counts:
+        record_rating(rating, -count)
+    Feedback.query.filter_by(user_id=user_id).delete()
+
+def rebuild_rollup():
+    """Recompute the rollup from the feedback table"""
+    counts = dict(db.session.query(Feedback.rating, db.func.count(Feedback.id)).group_by(Feedback.rating).all())
+    FeedbackRollup.query.delete()
+    db.session.execute(
+        FeedbackRollup.__table__.insert(),
+        [{'rating': rating, 'count': counts.get(rating, 0)} for rating in RATINGS]
+    )
+    db.session.commit()
+
+def rating_summary():
+    """Return (total, avg_rating, rating_counts).
+
+    Reads the five-row rollup, so the cost does not grow with the amount of
+    feedback. If the rollup has not been built yet (any of the five rows is
+    missing), aggregates in SQL.
+    """
+    counts = {row.rating: row.count for row in FeedbackRollup.query.all()}
+    if not all(rating in counts for rating in RATINGS):
+        counts = dict(db.session.query(Feedback.rating, db.func.count(Feedback.id)).group_by(Feedback.rating).all())
+
+    rating_counts = {rating: counts.get(rating, 0) for rating in RATINGS}
+    total = sum(rating_counts.values())
+    avg_rating = round(sum(rating * count for rating, count in rating_counts.items()) / total, 1) if total else 0
+    return total, avg_rating, rating_counts
+
+def feedback_page(before=None, per_page=50):
+    """Newest-first page of feedback using keyset pagination on id.
+
+    Returns (rows, next_cursor); pass next_cursor back as `before` for the
+    following page. It is None on the last page.
+    """
+    query = Feedback.query.options(db.joinedload(Feedback.user))
+    return keyset_page(query, Feedback.id, cursor=before, per_page=per_page, descending=True)
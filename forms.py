@@ -1,7 +1,8 @@
 from flask_wtf import FlaskForm, CSRFProtect
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, IntegerField, SelectField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, NumberRange
-from models import User
+from models import User, ChatbotKnowledge
+from knowledge_index import normalize_question
 from app import app
 
 # Initialize CSRF protection
@@ -42,6 +43,15 @@ class KnowledgeForm(FlaskForm):
     question = StringField('Question', validators=[DataRequired(), Length(min=5, max=500)])
     answer = TextAreaField('Answer', validators=[DataRequired(), Length(min=5)])
     submit = SubmitField('Save')
+    
+    def __init__(self, *args, knowledge_id=None, **kwargs):
+        super(KnowledgeForm, self).__init__(*args, **kwargs)
+        self.knowledge_id = knowledge_id
+    
+    def validate_question(self, question):
+        entry = ChatbotKnowledge.query.filter_by(question_normalized=normalize_question(question.data)).first()
+        if entry and entry.id != self.knowledge_id:
+            raise ValidationError('That question is already in the knowledge base.')
 
 class ProfileUpdateForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=2, max=20)])
@@ -0,0 +1,22 @@
+import gc
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# A worker never has more than `threads` calls of its own in flight, so size the LLM
+# pool to match with no queue: calls abandoned after LLM_TIMEOUT keep their slots
+# until they finish, and new calls are shed instead of piling up behind them
+os.environ.setdefault('LLM_MAX_CONCURRENCY', str(threads))
+os.environ.setdefault('LLM_MAX_QUEUE', '0')
+
+# Preload-then-fork: the master imports the app and loads the model once,
+# and the workers forked from it share that copy instead of each loading their own
+os.environ.setdefault('PRELOAD_MODEL', 'true')
+preload_app = os.environ['PRELOAD_MODEL'].lower() in ('1', 'true', 'yes')
+
+def when_ready(server):
+    # Move everything loaded so far out of the garbage collector's reach, so
+    # collections in the workers do not touch (and copy) the shared pages
+    gc.freeze()
@@ -0,0 +1,141 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from app import app, db
+from models import ChatHistory
+
+logger = logging.getLogger(__name__)
+
+class ChatHistoryWriter:
+    """Write-behind buffer for ChatHistory rows.
+
+    Chat turns are queued on the request thread and inserted by a background
+    thread in multi-row batches, either when batch_size rows are waiting or
+    every flush_interval seconds. If the queue is full the row is written
+    synchronously instead of being dropped. Remaining rows are flushed at exit.
+    """
+
+    def __init__(self, batch_size=50, flush_interval=1.0, max_queue=1000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def record(self, user_id, user_message, bot_response, source=None):
+        """Queue one chat turn for insertion"""
+        row = {
+            'user_id': user_id,
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'source': source,
+            'timestamp': datetime.utcnow()
+        }
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            logger.warning("Chat history queue is full, writing synchronously")
+            self._write([row])
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='chat-history-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._write_taken(batch)
+
+    def _drain(self, block):
+        """Collect up to batch_size rows, waiting at most flush_interval when blocking"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows):
+        """Insert rows with a single executemany (a multi-row INSERT on MySQL).
+
+        If the batch fails, the rows are retried one at a time so only the
+        failing ones (e.g. turns of a user deleted meanwhile) are dropped.
+        """
+        with self._flush_lock:
+            with app.app_context():
+                try:
+                    self._insert(rows)
+                    return
+                except Exception as e:
+                    if len(rows) == 1:
+                        logger.error("Error saving chat history row for user %s: %s", rows[0]['user_id'], e)
+                        return
+                    logger.warning("Error saving %d chat history rows, retrying one at a time: %s", len(rows), e)
+
+                for row in rows:
+                    try:
+                        self._insert([row])
+                    except Exception as e:
+                        logger.error("Dropping chat history row for user %s: %s", row['user_id'], e)
+
+    def _insert(self, rows):
+        try:
+            db.session.execute(ChatHistory.__table__.insert(), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _write_taken(self, rows):
+        """Write rows taken from the queue and mark them done, so flush() can wait for them"""
+        try:
+            self._write(rows)
+        finally:
+            for _ in rows:
+                self._queue.task_done()
+
+    def flush(self):
+        """Write everything queued so far and wait until it is committed.
+
+        This includes a batch the background thread has already taken from
+        the queue but not yet inserted.
+        """
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                break
+            self._write_taken(batch)
+        self._queue.join()
+
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+# Shared writer, configured from the environment
+history_writer = ChatHistoryWriter(
+    batch_size=int(os.environ.get('CHAT_HISTORY_BATCH_SIZE', '50')),
+    flush_interval=float(os.environ.get('CHAT_HISTORY_FLUSH_INTERVAL', '1.0')),
+    max_queue=int(os.environ.get('CHAT_HISTORY_QUEUE_SIZE', '1000'))
+)
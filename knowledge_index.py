@@ -0,0 +1,191 @@
+import re
+import heapq
+from collections import namedtuple
+
+# Lightweight copy of a knowledge base row, detached from the DB session
+KnowledgeRecord = namedtuple('KnowledgeRecord', ['id', 'question', 'answer'])
+
+_whitespace_re = re.compile(r'\s+')
+
+def normalize_question(text):
+    """Normalize a question for exact matching (case and whitespace insensitive)"""
+    if not text:
+        return ''
+    return _whitespace_re.sub(' ', text).strip().lower()
+
+class RecordTable:
+    """List-like table of KnowledgeRecords indexed by matrix row.
+
+    The base rows may be a plain list or a read-only memory-mapped store;
+    appended rows and tombstones (rows set to None) live in a small overlay
+    so the shared base is never modified.
+    """
+
+    def __init__(self, base=None):
+        self.base = base if base is not None else []
+        self.extra = []
+        self.overrides = {}
+
+    def __len__(self):
+        return len(self.base) + len(self.extra)
+
+    def __getitem__(self, row):
+        if row in self.overrides:
+            return self.overrides[row]
+        if row < len(self.base):
+            return self.base[row]
+        return self.extra[row - len(self.base)]
+
+    def __setitem__(self, row, record):
+        if row >= len(self.base):
+            self.extra[row - len(self.base)] = record
+        else:
+            self.overrides[row] = record
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def append(self, record):
+        self.extra.append(record)
+
+    def copy(self):
+        """New table sharing the base rows, with its own copy of the overlay"""
+        table = RecordTable(self.base)
+        table.extra = list(self.extra)
+        table.overrides = dict(self.overrides)
+        return table
+
+class KnowledgeIndex:
+    """In-memory lookup structures for the knowledge base.
+
+    Exact matches go through a hash map keyed by the normalized question.
+    Substring matches (the old ILIKE '%msg%' lookup) go through an inverted
+    index of character n-grams; candidates are verified with a real substring
+    check so results match the SQL behaviour. Only entry ids are stored;
+    callers resolve them to records.
+
+    The id sets are frozensets that add() and remove() replace rather than
+    modify, so lookups can run while an edit is applied under the model lock.
+    """
+
+    def __init__(self, ngram_size=3):
+        self.ngram_size = ngram_size
+        self.normalized = {}
+        self.exact = {}
+        self.postings = {}
+
+    @classmethod
+    def build(cls, entries, ngram_size=3):
+        """Build an index from ChatbotKnowledge rows (or anything with id/question)"""
+        index = cls(ngram_size=ngram_size)
+        # Fill mutable sets first; growing a frozenset per entry would be quadratic
+        exact, postings = {}, {}
+        for entry in entries:
+            index.normalized[entry.id] = normalize_question(entry.question)
+        for entry_id, key in index.normalized.items():
+            exact.setdefault(key, set()).add(entry_id)
+            for gram in index._ngrams(key):
+                postings.setdefault(gram, set()).add(entry_id)
+        index.exact = {key: frozenset(ids) for key, ids in exact.items()}
+        index.postings = {gram: frozenset(ids) for gram, ids in postings.items()}
+        return index
+
+    def __len__(self):
+        return len(self.normalized)
+
+    def _ngrams(self, text):
+        n = self.ngram_size
+        if len(text) < n:
+            return set()
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def add(self, entry_id, question):
+        """Add or replace a single entry"""
+        if entry_id in self.normalized:
+            self.remove(entry_id)
+
+        key = normalize_question(question)
+        self.normalized[entry_id] = key
+
+        _link(self.exact, key, entry_id)
+        for gram in self._ngrams(key):
+            _link(self.postings, gram, entry_id)
+
+    def remove(self, entry_id):
+        """Remove an entry if present"""
+        key = self.normalized.pop(entry_id, None)
+        if key is None:
+            return
+
+        _unlink(self.exact, key, entry_id)
+        for gram in self._ngrams(key):
+            _unlink(self.postings, gram, entry_id)
+
+    def find_exact(self, query):
+        """Return the id of the entry whose normalized question equals the query, or None"""
+        ids = self.exact.get(normalize_question(query))
+        if not ids:
+            return None
+        # Lowest id wins on duplicates, like the first row of the old query
+        return min(ids)
+
+    def _candidates(self, key):
+        """Ids that share every n-gram of key (a superset of the real matches)"""
+        grams = self._ngrams(key)
+        if not grams:
+            # Too short to have an n-gram: only an exact match is looked up, never a scan
+            return self.exact.get(key, frozenset())
+
+        # Intersect the smallest posting lists first
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+            ids = self.postings.get(gram)
+            if not ids:
+                return set()
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return set()
+        return candidates
+
+    def find_containing(self, query):
+        """Return the lowest id whose question contains the query, or None"""
+        key = normalize_question(query)
+        if not key:
+            return None
+
+        for entry_id in sorted(self._candidates(key)):
+            if key in self.normalized.get(entry_id, ''):
+                return entry_id
+        return None
+
+    def find_all_containing(self, query, after=None, limit=None):
+        """Ids whose question contains the query, ascending, starting after `after`"""
+        key = normalize_question(query)
+        if not key:
+            return []
+
+        matches = (
+            entry_id for entry_id in self._candidates(key)
+            if (after is None or entry_id > after) and key in self.normalized.get(entry_id, '')
+        )
+        if limit is None:
+            return sorted(matches)
+        return heapq.nsmallest(limit, matches)
+
+    def lookup(self, query):
+        """Exact match first, then substring match; mirrors the old SQL lookups"""
+        entry_id = self.find_exact(query)
+        if entry_id is None:
+            entry_id = self.find_containing(query)
+        return entry_id
+
+def _link(index, name, entry_id):
+    index[name] = index.get(name, frozenset()) | {entry_id}
+
+def _unlink(index, name, entry_id):
+    ids = index.get(name, frozenset()) - {entry_id}
+    if ids:
+        index[name] = ids
+    else:
+        index.pop(name, None)
@@ -0,0 +1,84 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+class LLMOverloaded(Exception):
+    """Raised when the dispatch queue is full and the call was shed"""
+
+class LLMTimeout(Exception):
+    """Raised when a dispatched call did not finish within its timeout"""
+
+class LLMDispatcher:
+    """Bounded worker pool for outbound LLM calls.
+
+    At most max_workers calls run at once and at most max_queue more wait
+    for a free worker. Anything beyond that is rejected immediately with
+    LLMOverloaded instead of piling up behind slow completions.
+    """
+
+    def __init__(self, max_workers=8, max_queue=16, timeout=20.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-dispatch')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._shed = 0
+        self._timeouts = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue a call and return its Future, or raise LLMOverloaded if the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._shed += 1
+            raise LLMOverloaded("LLM dispatch queue is full")
+
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def call(self, fn, *args, timeout=None, **kwargs):
+        """Run fn on the pool and wait for its result, raising LLMTimeout after the timeout"""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Drop it if it never started; a running call finishes in the background
+            future.cancel()
+            with self._lock:
+                self._timeouts += 1
+            raise LLMTimeout(f"LLM call did not finish within {timeout} seconds")
+
+    def stats(self):
+        """Snapshot of the pool state"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'pending': self._pending,
+                'shed': self._shed,
+                'timeouts': self._timeouts
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+# Shared dispatcher, configured from the environment
+llm_dispatcher = LLMDispatcher(
+    max_workers=int(os.environ.get('LLM_MAX_CONCURRENCY', '8')),
+    max_queue=int(os.environ.get('LLM_MAX_QUEUE', '16')),
+    timeout=float(os.environ.get('LLM_TIMEOUT', '20'))
+)
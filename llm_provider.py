@@ -0,0 +1,159 @@
+import os
+import abc
+import time
+import random
+import hashlib
+import threading
+from metrics import llm_tokens
+
+class LLMProviderError(Exception):
+    """Raised by a provider when the completion API call fails"""
+
+class LLMProvider(abc.ABC):
+    """Interface for chat completion backends.
+
+    Subclasses implement complete() and open_stream(). Providers that count
+    tokens for complete() set reports_usage; the caller estimates usage for
+    the others.
+    """
+
+    name = None
+    reports_usage = False
+
+    def __init__(self, model='gpt-3.5-turbo', max_tokens=150, temperature=0.7, timeout=20.0):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.timeout = timeout
+
+    @abc.abstractmethod
+    def complete(self, messages):
+        """Return the reply text for a list of chat messages"""
+
+    @abc.abstractmethod
+    def open_stream(self, messages):
+        """Make the request and return an iterator over reply text chunks"""
+
+class OpenAIProvider(LLMProvider):
+    """Chat completions through the OpenAI API (or anything at OPENAI_BASE_URL)"""
+
+    name = 'openai'
+    reports_usage = True
+
+    def __init__(self, client, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+
+    def _create(self, messages, **kwargs):
+        return self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            timeout=self.timeout,
+            **kwargs
+        )
+
+    def complete(self, messages):
+        response = self._create(messages)
+        if response.usage is not None:
+            llm_tokens.inc(response.usage.prompt_tokens, kind='prompt')
+            llm_tokens.inc(response.usage.completion_tokens, kind='completion')
+        return response.choices[0].message.content.strip()
+
+    def open_stream(self, messages):
+        stream = self._create(messages, stream=True)
+        return (
+            chunk.choices[0].delta.content
+            for chunk in stream
+            if chunk.choices and chunk.choices[0].delta.content
+        )
+
+class FakeProvider(LLMProvider):
+    """Deterministic in-process stand-in for load tests and offline CI.
+
+    Replies are derived from the prompt, so the same messages always get the
+    same text. Each call sleeps for latency seconds plus up to jitter, and
+    fails with LLMProviderError with probability failure_rate. The random
+    draws come from a seeded generator, so a test run can be replayed.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.5, jitter=0.0, failure_rate=0.0, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def _draw(self):
+        """Return (delay, fail) for the next call"""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        return delay, fail
+
+    def reply(self, messages):
+        prompt = messages[-1]['content'] if messages else ''
+        passages = max(sum(1 for message in messages if message['role'] == 'system') - 1, 0)
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]
+        return f"Offline answer {digest} to: {prompt} ({passages} context messages)"
+
+    def complete(self, messages):
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise LLMProviderError("Simulated API error from the fake provider")
+        return self.reply(messages)
+
+    def open_stream(self, messages):
+        delay, fail = self._draw()
+        # Time to first token is part of opening the stream, like a real request
+        time.sleep(delay / 2)
+        if fail:
+            raise LLMProviderError("Simulated API error from the fake provider")
+        words = self.reply(messages).split(' ')
+        return self._chunks(words, delay / 2 / max(len(words), 1))
+
+    def _chunks(self, words, delay):
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            yield word if i == 0 else ' ' + word
+
+def create_llm_provider(api_key=None):
+    """Build the provider named by LLM_PROVIDER, or None if OpenAI has no API key.
+
+    Model and sampling settings come from LLM_MODEL, LLM_MAX_TOKENS,
+    LLM_TEMPERATURE and LLM_TIMEOUT; the fake provider also reads
+    FAKE_LLM_LATENCY, FAKE_LLM_JITTER, FAKE_LLM_FAILURE_RATE and FAKE_LLM_SEED.
+    """
+    settings = {
+        'model': os.environ.get('LLM_MODEL', 'gpt-3.5-turbo'),
+        'max_tokens': int(os.environ.get('LLM_MAX_TOKENS', '150')),
+        'temperature': float(os.environ.get('LLM_TEMPERATURE', '0.7')),
+        'timeout': float(os.environ.get('LLM_TIMEOUT', '20'))
+    }
+    name = os.environ.get('LLM_PROVIDER', OpenAIProvider.name)
+
+    if name == FakeProvider.name:
+        return FakeProvider(
+            latency=float(os.environ.get('FAKE_LLM_LATENCY', '0.5')),
+            jitter=float(os.environ.get('FAKE_LLM_JITTER', '0')),
+            failure_rate=float(os.environ.get('FAKE_LLM_FAILURE_RATE', '0')),
+            seed=int(os.environ.get('FAKE_LLM_SEED', '0')),
+            **settings
+        )
+    if name != OpenAIProvider.name:
+        raise ValueError(f"Unknown LLM provider: {name}")
+    if not api_key:
+        return None
+    # The OpenAI SDK is slow to import, so only load it when it is used
+    import openai
+    return OpenAIProvider(openai.OpenAI(api_key=api_key), **settings)
@@ -1,6 +1,5 @@
 import os
 import sys
-import csv
 from app import app, db
 from models import ChatbotKnowledge
 from train_model import train_model_from_csv
@@ -22,40 +21,14 @@ def verify_knowledge_database():
                     print(f"Error: Sample knowledge file not found at {csv_file}")
                     return False
                 
-                # Verify CSV file content before loading
-                try:
-                    with open(csv_file, 'r', encoding='utf-8') as f:
-                        reader = csv.reader(f)
-                        header = next(reader)
-                        if len(header) < 2 or header[0].lower() != 'question' or header[1].lower() != 'answer':
-                            print(f"Error: CSV file has invalid format. Expected headers: question,answer")
-                            return False
-                        
-                        # Count rows to verify content
-                        row_count = sum(1 for row in reader if len(row) >= 2)
-                        print(f"Found {row_count} valid entries in {csv_file}")
-                        
-                        if row_count == 0:
-                            print("Error: No valid entries found in CSV file")
-                            return False
-                except Exception as e:
-                    print(f"Error reading CSV file: {e}")
-                    return False
-                
-                # Load the knowledge base
-                success = train_model_from_csv(csv_file)
+                # Validate, import and train in a single pass over the file
+                success = train_model_from_csv(csv_file, validate_header=True)
                 if success:
                     # Verify the knowledge was loaded
                     new_count = ChatbotKnowledge.query.count()
                     print(f"Successfully loaded knowledge database. New entry count: {new_count}")
-                    
-                    # Ensure the AI model is trained with the new data
-                    if ai_model.train():
-                        print("Successfully trained AI model with the loaded knowledge.")
-                        return True
-                    else:
-                        print("Warning: Failed to train AI model with the loaded knowledge.")
-                        return False
+                    print("Successfully trained AI model with the loaded knowledge.")
+                    return True
                 else:
                     print("Failed to load knowledge database.")
                     return False
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from metrics import registry, Counter
+
+# Attributes every LogRecord has; anything else came in through extra= and is a structured field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+log_records_dropped = registry.register(Counter(
+    'log_records_dropped', "Log records dropped because the log queue was full", labels=('logger',)
+))
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extra= fields"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of the records tagged with a stage (extra={'stage': ...}).
+
+    rates maps stage names to the fraction kept; stages not listed use
+    default_rate. Warnings and errors are never sampled away, and records
+    without a stage always pass.
+    """
+
+    def __init__(self, rates=None, default_rate=1.0):
+        super().__init__()
+        self.rates = rates or {}
+        self.default_rate = default_rate
+
+    def filter(self, record):
+        stage = getattr(record, 'stage', None)
+        if stage is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(stage, self.default_rate)
+        return rate >= 1.0 or random.random() < rate
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks the caller: records are dropped when the queue is full.
+
+    Formatting is left to the listener thread; only the message string is
+    resolved here, so later changes to mutable arguments do not leak into it.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc(logger=record.name)
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """Listener whose stop() waits for room in a full queue instead of raising"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+def parse_sample_rates(text):
+    """Parse LOG_SAMPLE_RATES, e.g. "chat_request=0.1,retrieval=0.01" """
+    rates = {}
+    for item in (text or '').split(','):
+        if not item.strip():
+            continue
+        stage, _, rate = item.partition('=')
+        rates[stage.strip()] = float(rate)
+    return rates
+
+_handler = None
+_listener = None
+
+def _start_listener(output):
+    global _listener
+    _listener = DrainingQueueListener(_handler.queue, output)
+    _listener.start()
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+def _restart_after_fork():
+    """Give a forked child its own queue and listener; the parent's thread does not survive fork"""
+    if _handler is not None:
+        _handler.queue = queue.Queue(maxsize=_handler.queue.maxsize)
+        _start_listener(*_listener.handlers)
+
+def configure_logging():
+    """Route all logging through a bounded queue written by a background thread.
+
+    Reads LOG_LEVEL (default INFO), LOG_FORMAT (json or text, default json),
+    LOG_SAMPLE_RATE and LOG_SAMPLE_RATES for stage-tagged records, and
+    LOG_QUEUE_SIZE. Safe to call more than once; later calls do nothing.
+    """
+    global _handler
+    if _handler is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    if os.environ.get('LOG_FORMAT', 'json') == 'text':
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    handler = _handler = DroppingQueueHandler(queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', '10000'))))
+    handler.addFilter(SamplingFilter(
+        parse_sample_rates(os.environ.get('LOG_SAMPLE_RATES')),
+        default_rate=float(os.environ.get('LOG_SAMPLE_RATE', '1.0'))
+    ))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+    _start_listener(output)
+    # Flush whatever is still queued when the process exits
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        # Pre-forking servers (gunicorn --preload) import the app before forking workers
+        os.register_at_fork(after_in_child=_restart_after_fork)
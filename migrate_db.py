@@ -0,0 +1,109 @@
+import sys
+from datetime import datetime
+from app import app, db
+from models import ChatbotKnowledge, ChatHistory, Feedback, FeedbackRollup
+from feedback_stats import rebuild_rollup
+from knowledge_index import normalize_question
+
+# Applied revisions are recorded here so each step runs once per database
+revisions_table = db.Table(
+    'schema_revisions',
+    db.Column('revision', db.String(64), primary_key=True),
+    db.Column('applied_at', db.DateTime, nullable=False)
+)
+
+def _columns(table_name):
+    return {column['name'] for column in db.inspect(db.engine).get_columns(table_name)}
+
+def _indexes(table_name):
+    return {index['name'] for index in db.inspect(db.engine).get_indexes(table_name)}
+
+def _create_missing_indexes(table):
+    existing = _indexes(table.name)
+    for index in table.indexes:
+        if index.name not in existing:
+            print(f"Creating index {index.name}")
+            index.create(bind=db.engine)
+
+def _backfill_question_normalized(batch_size=1000):
+    """Fill question_normalized in id order, one batch per transaction"""
+    last_id = 0
+    while True:
+        rows = db.session.query(ChatbotKnowledge.id, ChatbotKnowledge.question).filter(
+            ChatbotKnowledge.id > last_id
+        ).order_by(ChatbotKnowledge.id).limit(batch_size).all()
+        if not rows:
+            return
+        db.session.execute(
+            ChatbotKnowledge.__table__.update().where(ChatbotKnowledge.__table__.c.id == db.bindparam('row_id')),
+            [{'row_id': row_id, 'question_normalized': normalize_question(question)} for row_id, question in rows]
+        )
+        db.session.commit()
+        last_id = rows[-1].id
+
+def _duplicate_questions():
+    return db.session.query(
+        ChatbotKnowledge.question_normalized, db.func.count(ChatbotKnowledge.id)
+    ).group_by(ChatbotKnowledge.question_normalized).having(db.func.count(ChatbotKnowledge.id) > 1).all()
+
+def upgrade_0001():
+    """Normalized question column with a unique index, composite history/feedback indexes, chat source"""
+    if 'question_normalized' not in _columns('chatbot_knowledge'):
+        print("Adding chatbot_knowledge.question_normalized")
+        db.session.execute(db.text("ALTER TABLE chatbot_knowledge ADD COLUMN question_normalized VARCHAR(500) NULL"))
+        db.session.commit()
+    _backfill_question_normalized()
+
+    duplicates = _duplicate_questions()
+    if duplicates:
+        print("Error: these questions are duplicated after normalization; merge or delete them and run again:")
+        for question, count in duplicates:
+            print(f"  {count} x {question}")
+        return False
+
+    if db.engine.dialect.name == 'mysql':
+        db.session.execute(db.text("ALTER TABLE chatbot_knowledge MODIFY question_normalized VARCHAR(500) NOT NULL"))
+        db.session.commit()
+    _create_missing_indexes(ChatbotKnowledge.__table__)
+
+    _create_missing_indexes(ChatHistory.__table__)
+    _create_missing_indexes(Feedback.__table__)
+
+    if 'source' not in _columns('chat_history'):
+        print("Adding chat_history.source")
+        db.session.execute(db.text("ALTER TABLE chat_history ADD COLUMN source VARCHAR(32) NULL"))
+        db.session.commit()
+    return True
+
+def upgrade_0002():
+    """Per-rating feedback rollup for the admin dashboard"""
+    FeedbackRollup.__table__.create(bind=db.engine, checkfirst=True)
+    rebuild_rollup()
+    return True
+
+REVISIONS = [
+    ('0001_hot_lookup_indexes', upgrade_0001),
+    ('0002_feedback_rollup', upgrade_0002),
+]
+
+def migrate():
+    """Apply every revision not yet recorded in schema_revisions"""
+    revisions_table.create(bind=db.engine, checkfirst=True)
+    applied = {revision for (revision,) in db.session.execute(db.select(revisions_table.c.revision))}
+
+    for revision, upgrade in REVISIONS:
+        if revision in applied:
+            continue
+        print(f"Applying {revision}: {upgrade.__doc__}")
+        if not upgrade():
+            print(f"Revision {revision} failed; later revisions were not applied.")
+            return False
+        db.session.execute(revisions_table.insert().values(revision=revision, applied_at=datetime.utcnow()))
+        db.session.commit()
+
+    print("Database schema is up to date.")
+    return True
+
+if __name__ == "__main__":
+    with app.app_context():
+        sys.exit(0 if migrate() else 1)
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import tempfile
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from knowledge_index import KnowledgeRecord
+
+# Bump when the on-disk layout changes; older artifacts are then ignored
+ARTIFACT_FORMAT = 2
+
+DEFAULT_ARTIFACT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'model')
+
+def artifact_dir():
+    """Directory holding trained model artifacts"""
+    return os.environ.get('MODEL_ARTIFACT_DIR', DEFAULT_ARTIFACT_DIR)
+
+class MappedRecords:
+    """Read-only question/answer store backed by memory-mapped files.
+
+    Every worker that opens the same artifact maps the same pages, so the
+    answer text is held once per node instead of once per process.
+    """
+
+    def __init__(self, path):
+        self.row_ids = np.load(os.path.join(path, 'row_ids.npy'), mmap_mode='r')
+        self.question_offsets = np.load(os.path.join(path, 'question_offsets.npy'), mmap_mode='r')
+        self.answer_offsets = np.load(os.path.join(path, 'answer_offsets.npy'), mmap_mode='r')
+        self.questions = _map_blob(os.path.join(path, 'questions.bin'))
+        self.answers = _map_blob(os.path.join(path, 'answers.bin'))
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def __getitem__(self, row):
+        return KnowledgeRecord(
+            int(self.row_ids[row]),
+            _decode(self.questions, self.question_offsets, row),
+            _decode(self.answers, self.answer_offsets, row)
+        )
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+def _map_blob(path):
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='r')
+
+def _decode(blob, offsets, row):
+    return blob[offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+
+def _write_blob(path, texts):
+    """Write texts back to back and return their start/end offsets"""
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    with open(path, 'wb') as f:
+        for i, text in enumerate(texts):
+            data = text.encode('utf-8')
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    return offsets
+
+def save_artifact(vectorizer, vectors, records, fingerprint, base_dir=None, retriever=None, updated_at=None):
+    """Write a versioned artifact and point LATEST at it.
+
+    Layout of each version directory:
+      manifest.json  format, generation, KB fingerprint and latest updated_at, matrix shape, creation time
+      vocabulary.json, idf.npy  fitted TfidfVectorizer state
+      data.npy, indices.npy, indptr.npy  CSR matrix of question vectors
+      row_ids.npy    knowledge base id for each matrix row
+      questions.bin, answers.bin and their *_offsets.npy  UTF-8 text store
+      retriever.json and backend files  retrieval index, if one is given
+
+    All .npy and .bin files are memory-mapped when loaded. The LATEST file
+    holds "<generation> <version>" so workers can notice a newer artifact.
+    The generation is claimed under a lock on the artifact directory, so
+    concurrent saves get distinct generations and LATEST never goes back.
+    """
+    base_dir = base_dir or artifact_dir()
+    os.makedirs(base_dir, exist_ok=True)
+
+    vectors = sparse.csr_matrix(vectors)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=base_dir)
+    try:
+        vocabulary = {term: int(index) for term, index in vectorizer.vocabulary_.items()}
+        with open(os.path.join(staging, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+            json.dump(vocabulary, f)
+        np.save(os.path.join(staging, 'idf.npy'), vectorizer.idf_)
+        np.save(os.path.join(staging, 'data.npy'), vectors.data)
+        np.save(os.path.join(staging, 'indices.npy'), vectors.indices)
+        np.save(os.path.join(staging, 'indptr.npy'), vectors.indptr)
+        np.save(os.path.join(staging, 'row_ids.npy'), np.array([r.id for r in records], dtype=np.int64))
+        np.save(os.path.join(staging, 'question_offsets.npy'),
+                _write_blob(os.path.join(staging, 'questions.bin'), [r.question for r in records]))
+        np.save(os.path.join(staging, 'answer_offsets.npy'),
+                _write_blob(os.path.join(staging, 'answers.bin'), [r.answer for r in records]))
+        if retriever is not None:
+            retriever.save(staging)
+
+        # Only claiming, publishing and pruning are serialized; the files above are written in parallel
+        with open(os.path.join(base_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            generation = current_generation(base_dir) + 1
+            version = f"v{ARTIFACT_FORMAT}-{generation}-{fingerprint[:16]}-{os.getpid()}"
+            with open(os.path.join(staging, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump({
+                    'format': ARTIFACT_FORMAT,
+                    'generation': generation,
+                    'fingerprint': fingerprint,
+                    'updated_at': updated_at,
+                    'shape': list(vectors.shape),
+                    'rows': len(records),
+                    'created_at': time.time()
+                }, f)
+            os.replace(staging, os.path.join(base_dir, version))
+
+            # Publish atomically so readers never see a half-written pointer
+            pointer_tmp = os.path.join(base_dir, f'.LATEST.{os.getpid()}')
+            with open(pointer_tmp, 'w') as f:
+                f.write(f"{generation} {version}")
+            os.replace(pointer_tmp, os.path.join(base_dir, 'LATEST'))
+            _prune_old_versions(base_dir, keep=version)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return os.path.join(base_dir, version)
+
+def _prune_old_versions(base_dir, keep, retain=2):
+    """Remove all but the newest `retain` artifact versions"""
+    versions = sorted(
+        (name for name in os.listdir(base_dir) if name.startswith('v') and name != keep),
+        key=lambda name: os.path.getmtime(os.path.join(base_dir, name)),
+        reverse=True
+    )
+    # Pages of a removed version stay valid for workers that still map them
+    for name in versions[retain - 1:]:
+        shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
+
+def _read_pointer(base_dir):
+    with open(os.path.join(base_dir, 'LATEST')) as f:
+        generation, version = f.read().split()
+    return int(generation), version
+
+def current_generation(base_dir=None):
+    """Generation number of the latest published artifact, or 0 if there is none"""
+    try:
+        return _read_pointer(base_dir or artifact_dir())[0]
+    except (OSError, ValueError):
+        return 0
+
+def read_manifest(base_dir=None):
+    """Return (version path, manifest) for the latest artifact, or (None, None)"""
+    base_dir = base_dir or artifact_dir()
+    try:
+        path = os.path.join(base_dir, _read_pointer(base_dir)[1])
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    if manifest.get('format') != ARTIFACT_FORMAT:
+        return None, None
+    return path, manifest
+
+def load_artifact(path, manifest):
+    """Map an artifact version directory and return (vectorizer, vectors, records)"""
+    with open(os.path.join(path, 'vocabulary.json'), encoding='utf-8') as f:
+        vocabulary = json.load(f)
+    vectorizer = TfidfVectorizer(vocabulary=vocabulary)
+    vectorizer.idf_ = np.load(os.path.join(path, 'idf.npy'))
+
+    # copy=False keeps the matrix on the shared read-only pages
+    vectors = sparse.csr_matrix((
+        np.load(os.path.join(path, 'data.npy'), mmap_mode='r'),
+        np.load(os.path.join(path, 'indices.npy'), mmap_mode='r'),
+        np.load(os.path.join(path, 'indptr.npy'), mmap_mode='r')
+    ), shape=tuple(manifest['shape']), copy=False)
+
+    return vectorizer, vectors, MappedRecords(path)
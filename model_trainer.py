@@ -0,0 +1,75 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BackgroundTrainer:
+    """Runs model builds on one background thread so requests never wait for them.
+
+    request() asks for a run of target and returns at once. Requests made
+    while a run is queued or in progress are merged into it, so a burst of
+    requests against a cold model trains it once. After a failed run,
+    requests are ignored for retry_interval seconds.
+    """
+
+    def __init__(self, target, retry_interval=30.0):
+        self.target = target
+        self.retry_interval = retry_interval
+        self._wanted = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._last_failure = None
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+
+    def request(self):
+        """Ask for a run; returns False if it was skipped because the last run failed recently"""
+        if self.running:
+            return True
+        if self._last_failure is not None and time.monotonic() - self._last_failure < self.retry_interval:
+            return False
+        self._wanted.set()
+        self._ensure_started()
+        return True
+
+    def _ensure_started(self):
+        # Also restarts the thread in a forked child, where it no longer exists
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='model-trainer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wanted.wait()
+            self.running = True
+            self._wanted.clear()
+            started = time.perf_counter()
+            try:
+                ok = self.target()
+            except Exception as e:
+                logger.error("Background model build failed: %s", e, exc_info=True)
+                ok = False
+            finally:
+                self.running = False
+
+            if ok:
+                self.runs += 1
+                self._last_failure = None
+                # Most runs only check for changes; builds and loads log their own lines
+                logger.debug("Background model sync finished in %.2fs", time.perf_counter() - started)
+            else:
+                self.failures += 1
+                self._last_failure = time.monotonic()
+
+    def stats(self):
+        return {'running': self.running, 'runs': self.runs, 'failures': self.failures}
+
+def create_trainer(target):
+    """Build a background trainer configured from the environment"""
+    return BackgroundTrainer(target, retry_interval=float(os.environ.get('MODEL_TRAIN_RETRY_INTERVAL', '30')))
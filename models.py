@@ -1,6 +1,8 @@
 from app import db
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from datetime import datetime
+from knowledge_index import normalize_question
 
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
@@ -14,25 +16,39 @@ class User(db.Model, UserMixin):
     
     # Relationships
     feedback = db.relationship('Feedback', backref='user', lazy=True)
-    chat_history = db.relationship('ChatHistory', backref='user', lazy=True)
+    # Dynamic: user.chat_history is a query, never a full load of every turn
+    chat_history = db.relationship('ChatHistory', backref='user', lazy='dynamic')
     
     def __repr__(self):
         return f'<User {self.username}>'
 
 class ChatbotKnowledge(db.Model):
     __tablename__ = 'chatbot_knowledge'
+    __table_args__ = (
+        db.Index('ux_chatbot_knowledge_question_normalized', 'question_normalized', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     question = db.Column(db.String(500), nullable=False)
+    # Lowercased, whitespace-collapsed question; backs exact-match lookups and dedup
+    question_normalized = db.Column(db.String(500), nullable=False)
     answer = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    @validates('question')
+    def _normalize_question(self, key, question):
+        self.question_normalized = normalize_question(question)
+        return question
+    
     def __repr__(self):
         return f'<ChatbotKnowledge {self.question[:30]}>'
 
 class Feedback(db.Model):
     __tablename__ = 'feedback'
+    __table_args__ = (
+        db.Index('ix_feedback_user_id_created_at', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -43,13 +59,27 @@ class Feedback(db.Model):
     def __repr__(self):
         return f'<Feedback {self.id} - Rating: {self.rating}>'
 
+class FeedbackRollup(db.Model):
+    __tablename__ = 'feedback_rollup'
+    
+    # One row per rating value, kept in step with Feedback inserts and deletes
+    rating = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<FeedbackRollup {self.rating}: {self.count}>'
+
 class ChatHistory(db.Model):
     __tablename__ = 'chat_history'
+    __table_args__ = (
+        db.Index('ix_chat_history_user_id_timestamp', 'user_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     user_message = db.Column(db.Text, nullable=False)
     bot_response = db.Column(db.Text, nullable=False)
+    source = db.Column(db.String(32), nullable=True)  # knowledge_base, hybrid, openai, fallback, ...
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
@@ -0,0 +1,28 @@
+from datetime import datetime
+from flask import request
+
+def keyset_page(query, column, cursor=None, per_page=50, descending=False):
+    """Return (rows, next_cursor) for one page of query ordered by a unique column.
+
+    Instead of OFFSET, the page starts just past `cursor` (the last value of
+    the previous page), so every page is an index range scan of per_page
+    rows regardless of how deep it is. next_cursor is None on the last page.
+    """
+    if cursor is not None:
+        query = query.filter(column < cursor if descending else column > cursor)
+    rows = query.order_by(column.desc() if descending else column).limit(per_page + 1).all()
+    next_cursor = getattr(rows[per_page - 1], column.key) if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
+
+def page_size(default=50, maximum=200):
+    """per_page from the query string, clamped to 1..maximum"""
+    return max(1, min(request.args.get('per_page', default, type=int), maximum))
+
+def encode_time_cursor(timestamp, row_id):
+    """Opaque cursor for a (timestamp, id) position"""
+    return f"{timestamp.isoformat()}_{row_id}"
+
+def decode_time_cursor(cursor):
+    """Inverse of encode_time_cursor; raises ValueError on a malformed cursor"""
+    timestamp, _, row_id = cursor.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(row_id)
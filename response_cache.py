@@ -0,0 +1,155 @@
+import os
+import re
+import time
+import threading
+import numpy as np
+from collections import OrderedDict, namedtuple
+from scipy import sparse
+from knowledge_index import normalize_question
+
+CacheEntry = namedtuple('CacheEntry', ['vector', 'response', 'expires_at'])
+
+_punctuation_re = re.compile(r'[^\w\s]')
+
+def cache_key(query, context_id):
+    """Key for exact hits: normalized question without punctuation, plus the context entries"""
+    return (normalize_question(_punctuation_re.sub(' ', query or '')), context_id)
+
+def context_entries(context_id):
+    """Knowledge base entry ids behind a context id (None, one id, or a tuple of ids)"""
+    if context_id is None:
+        return ()
+    if isinstance(context_id, tuple):
+        return context_id
+    return (context_id,)
+
+class ResponseCache:
+    """Cache of OpenAI answers keyed by normalized query and knowledge base context.
+
+    A lookup hits when the normalized query matches exactly, or when a cached
+    query with the same context entries is within `radius` cosine similarity of
+    the query's TF-IDF vector. Entries expire after `ttl` seconds and the
+    least recently used entry is evicted once `max_size` is reached.
+    The vectors of each context are stacked into one matrix on the first miss
+    after that context changes, so a miss does not restack them every time.
+    """
+
+    def __init__(self, max_size=1024, ttl=3600, radius=0.9):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.radius = radius
+        self._entries = OrderedDict()
+        self._by_context = {}
+        self._by_entry = {}
+        self._matrices = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, query, vector, context_id=None):
+        """Return a cached response for the query, or None"""
+        key = cache_key(query, context_id)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                self._discard(key)
+                entry = None
+
+            if entry is None and vector is not None and vector.nnz:
+                key = self._nearest(vector, context_id, now)
+                entry = self._entries.get(key) if key is not None else None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.response
+
+    def _nearest(self, vector, context_id, now):
+        """Find the closest live cached query with the same context within the radius"""
+        stacked = self._matrices.get(context_id)
+        if stacked is None:
+            keys = [k for k in self._by_context.get(context_id, ()) if self._entries[k].vector is not None]
+            if not keys:
+                return None
+            stacked = self._matrices[context_id] = (
+                keys,
+                sparse.vstack([self._entries[k].vector for k in keys], format='csr'),
+                np.array([self._entries[k].expires_at for k in keys])
+            )
+        keys, vectors, expires_at = stacked
+
+        # TF-IDF rows are L2-normalized, so the dot product is the cosine similarity
+        scores = (vectors @ vector.T).toarray().ravel()
+        scores[expires_at <= now] = -1.0
+        best = scores.argmax()
+        if scores[best] >= self.radius:
+            return keys[best]
+        return None
+
+    def put(self, query, vector, context_id, response, generation=None):
+        """Store a response for the query.
+
+        Pass the `generation` read before computing the vector; the entry is
+        dropped if the cache was cleared in the meantime.
+        """
+        key = cache_key(query, context_id)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = CacheEntry(vector, response, time.time() + self.ttl)
+            self._by_context.setdefault(context_id, set()).add(key)
+            self._matrices.pop(context_id, None)
+            for entry_id in context_entries(context_id):
+                self._by_entry.setdefault(entry_id, set()).add(key)
+
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        _remove_key(self._by_context, key[1], key)
+        self._matrices.pop(key[1], None)
+        for entry_id in context_entries(key[1]):
+            _remove_key(self._by_entry, entry_id, key)
+
+    def invalidate_entry(self, entry_id):
+        """Drop every answer that was generated with the given knowledge base entry in its context"""
+        with self._lock:
+            for key in list(self._by_entry.get(entry_id, ())):
+                self._discard(key)
+
+    def clear(self):
+        """Drop everything, e.g. when the vectorizer is refit and old vectors no longer compare"""
+        with self._lock:
+            self._entries.clear()
+            self._by_context.clear()
+            self._by_entry.clear()
+            self._matrices.clear()
+            self.generation += 1
+
+def _remove_key(index, name, key):
+    keys = index.get(name)
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del index[name]
+
+def create_response_cache():
+    """Build a response cache configured from the environment"""
+    return ResponseCache(
+        max_size=int(os.environ.get('RESPONSE_CACHE_SIZE', '1024')),
+        ttl=float(os.environ.get('RESPONSE_CACHE_TTL', '3600')),
+        radius=float(os.environ.get('RESPONSE_CACHE_RADIUS', '0.9'))
+    )
@@ -0,0 +1,229 @@
+import os
+import copy
+import json
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+class BruteForceRetriever:
+    """Exact retrieval: score every row with one sparse matrix product.
+
+    This is the reference backend; other backends are measured against it.
+    Retrievers only pick candidate rows. Scores always come from the
+    TF-IDF matrix, so every backend returns exact cosine similarities.
+    """
+
+    name = 'brute_force'
+
+    def build(self, vectors):
+        """Prepare the backend for the given question matrix"""
+        return self
+
+    def add(self, row, vector):
+        """Return a retriever that also covers a row appended to the matrix after build().
+
+        The retriever itself is left unchanged, so queries already searching
+        it with the previous matrix never see a row past its end.
+        """
+        return self
+
+    def search(self, vectors, query_vectors, k=5, live_rows=None, min_score=0.0):
+        """Return one (rows, scores) pair of arrays per query, best first"""
+        return _collect((query_vectors @ vectors.T).tocsr(), k, live_rows, min_score)
+
+    def save(self, path):
+        """Persist the backend next to a model artifact"""
+        _write_meta(path, {'name': self.name})
+
+class InvertedRetriever(BruteForceRetriever):
+    """Exact retrieval over a term-major copy of the matrix (one postings list per term).
+
+    A query only touches the postings of its own terms, so the cost grows
+    with how common those terms are instead of with the number of rows.
+    """
+
+    name = 'inverted'
+
+    def __init__(self):
+        self.postings = None
+
+    def build(self, vectors):
+        self.postings = vectors.T.tocsr()
+        return self
+
+    def add(self, row, vector):
+        # Appended rows become new columns; admin edits are rare enough for a copy
+        retriever = copy.copy(self)
+        retriever.postings = sparse.hstack([self.postings, vector.T], format='csr')
+        return retriever
+
+    def search(self, vectors, query_vectors, k=5, live_rows=None, min_score=0.0):
+        return _collect((query_vectors @ self.postings).tocsr(), k, live_rows, min_score)
+
+    def save(self, path):
+        _write_meta(path, {'name': self.name, 'shape': list(self.postings.shape)})
+        np.save(os.path.join(path, 'inverted_data.npy'), self.postings.data)
+        np.save(os.path.join(path, 'inverted_indices.npy'), self.postings.indices)
+        np.save(os.path.join(path, 'inverted_indptr.npy'), self.postings.indptr)
+
+    @classmethod
+    def load(cls, path, meta):
+        retriever = cls()
+        retriever.postings = sparse.csr_matrix((
+            np.load(os.path.join(path, 'inverted_data.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'inverted_indices.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'inverted_indptr.npy'), mmap_mode='r')
+        ), shape=tuple(meta['shape']), copy=False)
+        return retriever
+
+class IVFRetriever(BruteForceRetriever):
+    """Approximate retrieval with an inverted file over SVD-reduced TF-IDF vectors.
+
+    Rows are projected to `dimensions` with truncated SVD and clustered into
+    `n_lists` k-means cells. A query is projected the same way, the `n_probe`
+    nearest cells are scanned, and only their rows are scored exactly.
+    Raising n_probe trades latency for recall.
+    """
+
+    name = 'ivf'
+
+    def __init__(self, n_lists=None, n_probe=8, dimensions=128, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.dimensions = dimensions
+        self.seed = seed
+        self.components = None
+        self.centroids = None
+        self.list_rows = []
+
+    def build(self, vectors):
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.cluster import MiniBatchKMeans
+
+        n_rows, n_features = vectors.shape
+        n_lists = self.n_lists or max(1, int(np.sqrt(n_rows)))
+        n_lists = min(n_lists, n_rows)
+        dimensions = max(1, min(self.dimensions, n_features - 1, n_rows - 1))
+
+        svd = TruncatedSVD(n_components=dimensions, random_state=self.seed)
+        reduced = normalize(svd.fit_transform(vectors))
+        self.components = svd.components_.astype(np.float32)
+
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=self.seed, n_init=3, batch_size=4096)
+        assignments = kmeans.fit_predict(reduced)
+        self.centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+        self.list_rows = [np.flatnonzero(assignments == i) for i in range(n_lists)]
+        return self
+
+    def _project(self, query_vectors):
+        return normalize(np.asarray(query_vectors @ self.components.T))
+
+    def add(self, row, vector):
+        cell = int(np.argmax(self.centroids @ self._project(vector)[0]))
+        retriever = copy.copy(self)
+        retriever.list_rows = list(self.list_rows)
+        retriever.list_rows[cell] = np.append(self.list_rows[cell], row)
+        return retriever
+
+    def search(self, vectors, query_vectors, k=5, live_rows=None, min_score=0.0):
+        n_probe = min(self.n_probe, len(self.list_rows))
+        cell_scores = self._project(query_vectors) @ self.centroids.T
+
+        results = []
+        for i in range(query_vectors.shape[0]):
+            cells = np.argpartition(cell_scores[i], -n_probe)[-n_probe:]
+            rows = np.concatenate([self.list_rows[cell] for cell in cells]).astype(np.int64)
+            if len(rows) == 0:
+                results.append((rows, np.zeros(0)))
+                continue
+            scores = (vectors[rows] @ query_vectors[i].T).toarray().ravel()
+            results.append(_top_k(rows, scores, k, live_rows, min_score))
+        return results
+
+    def save(self, path):
+        _write_meta(path, {
+            'name': self.name,
+            'n_lists': len(self.list_rows),
+            'n_probe': self.n_probe,
+            'dimensions': self.dimensions,
+            'seed': self.seed
+        })
+        np.save(os.path.join(path, 'ivf_components.npy'), self.components)
+        np.save(os.path.join(path, 'ivf_centroids.npy'), self.centroids)
+        offsets = np.cumsum([0] + [len(rows) for rows in self.list_rows]).astype(np.int64)
+        flat = np.concatenate(self.list_rows).astype(np.int64)
+        np.save(os.path.join(path, 'ivf_offsets.npy'), offsets)
+        np.save(os.path.join(path, 'ivf_rows.npy'), flat)
+
+    @classmethod
+    def load(cls, path, meta):
+        retriever = cls(n_lists=meta['n_lists'], n_probe=meta['n_probe'], dimensions=meta['dimensions'], seed=meta['seed'])
+        retriever.components = np.load(os.path.join(path, 'ivf_components.npy'), mmap_mode='r')
+        retriever.centroids = np.load(os.path.join(path, 'ivf_centroids.npy'), mmap_mode='r')
+        offsets = np.load(os.path.join(path, 'ivf_offsets.npy'))
+        flat = np.load(os.path.join(path, 'ivf_rows.npy'), mmap_mode='r')
+        retriever.list_rows = [flat[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        return retriever
+
+def _collect(scores, k, live_rows, min_score):
+    """Top k per row of a sparse (queries x rows) score matrix"""
+    results = []
+    for i in range(scores.shape[0]):
+        start, end = scores.indptr[i], scores.indptr[i + 1]
+        results.append(_top_k(scores.indices[start:end], scores.data[start:end], k, live_rows, min_score))
+    return results
+
+def _top_k(rows, scores, k, live_rows, min_score):
+    """Filter to live rows above min_score and return the k best, sorted"""
+    keep = scores > min_score
+    if live_rows is not None:
+        keep &= live_rows[rows]
+    rows, scores = rows[keep], scores[keep]
+
+    # argpartition picks the top k in linear time; only those k get sorted
+    if len(scores) > k:
+        top = np.argpartition(scores, -k)[-k:]
+        rows, scores = rows[top], scores[top]
+    order = np.argsort(scores)[::-1]
+    return rows[order], scores[order]
+
+def _write_meta(path, meta):
+    with open(os.path.join(path, 'retriever.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+RETRIEVERS = {
+    BruteForceRetriever.name: BruteForceRetriever,
+    InvertedRetriever.name: InvertedRetriever,
+    IVFRetriever.name: IVFRetriever
+}
+
+def create_retriever(name=None, n_rows=None):
+    """Build an unfitted retriever from MODEL_RETRIEVER and the IVF_* settings.
+
+    Knowledge bases smaller than IVF_MIN_ROWS use brute force instead of IVF,
+    where an approximate index would cost more than it saves.
+    """
+    name = name or os.environ.get('MODEL_RETRIEVER', BruteForceRetriever.name)
+    if name == IVFRetriever.name and n_rows is not None and n_rows < int(os.environ.get('IVF_MIN_ROWS', '1000')):
+        name = BruteForceRetriever.name
+    if name == IVFRetriever.name:
+        return IVFRetriever(
+            n_lists=int(os.environ['IVF_LISTS']) if os.environ.get('IVF_LISTS') else None,
+            n_probe=int(os.environ.get('IVF_PROBE', '8')),
+            dimensions=int(os.environ.get('IVF_DIMENSIONS', '128'))
+        )
+    if name not in RETRIEVERS:
+        raise ValueError(f"Unknown retriever: {name}")
+    return RETRIEVERS[name]()
+
+def load_retriever(path):
+    """Load the retriever saved with an artifact, or None if there is none"""
+    try:
+        with open(os.path.join(path, 'retriever.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except OSError:
+        return None
+    retriever_class = RETRIEVERS[meta['name']]
+    if hasattr(retriever_class, 'load'):
+        return retriever_class.load(path, meta)
+    return retriever_class()
@@ -1,29 +1,49 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import app, db, login_manager
 from models import User, ChatbotKnowledge, Feedback, ChatHistory
 #from forms import LoginForm, RegistrationForm, FeedbackForm, KnowledgeForm, ProfileUpdateForm
 from forms import LoginForm, RegistrationForm, FeedbackForm, KnowledgeForm, ProfileUpdateForm, UserEditForm
+from history_writer import history_writer
+from user_cache import user_cache
+from conversation_memory import conversation_memory
+from pagination import keyset_page, page_size, encode_time_cursor, decode_time_cursor
+from feedback_stats import record_rating, remove_user_feedback, rating_summary, feedback_page
+from knowledge_index import normalize_question
+from db_pool import pool_status
+from llm_dispatch import llm_dispatcher
+from metrics import registry, request_seconds, span, Gauge
+from sqlalchemy import exc as sa_exc
 from datetime import datetime
 import os
+import hmac
+import json
+import time
 import logging
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
+# Handlers and levels are set up by log_config.configure_logging() in app.py
 logger = logging.getLogger(__name__)
 
-# Try to import AI model with error handling
-try:
-    from ai_model import ai_model, initialize_model
-    ai_model_available = True
-    logger.info("AI model imported successfully")
-except ImportError as e:
-    logger.error(f"Failed to import AI model: {e}")
-    ai_model_available = False
-except Exception as e:
-    logger.error(f"Error importing AI model: {e}")
-    ai_model_available = False
+_ai_model = None
+_ai_model_failed = False
+
+def get_ai_model():
+    """The AI model, imported on first use; None if it cannot be loaded.
+
+    Deferring the import keeps sklearn, numpy and the LLM client out of
+    startup for processes that never answer a chat message.
+    """
+    global _ai_model, _ai_model_failed
+    if _ai_model is None and not _ai_model_failed:
+        try:
+            from ai_model import ai_model
+            _ai_model = ai_model
+            logger.info("AI model imported successfully")
+        except Exception as e:
+            logger.error("Error importing AI model: %s", e)
+            _ai_model_failed = True
+    return _ai_model
 
 # Context processor to inject variables into all templates
 @app.context_processor
@@ -33,7 +53,8 @@ def inject_now():
 # User loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Served from a short-TTL snapshot so chat requests skip the users table
+    return user_cache.get(int(user_id))
 
 # Home route
 @app.route('/')
@@ -88,10 +109,12 @@ def chat():
 @app.route('/chat_api', methods=['POST'])
 @login_required
 def chat_api():
+    started = time.perf_counter()
     data = request.get_json()
     user_message = data.get('message', '').strip()
     
-    logger.info(f"Received message from user {current_user.id}: {user_message}")
+    # Message text only at DEBUG; per-turn lines are tagged with a stage for LOG_SAMPLE_RATES
+    logger.debug("Received message from user %s: %s", current_user.id, user_message, extra={'stage': 'chat_request'})
     
     if not user_message:
         return jsonify({
@@ -102,46 +125,43 @@ def chat_api():
     # Initialize response and source
     response = "I'm sorry, I encountered an error. Please try again."
     source = "error"
+    ai_model = get_ai_model()
     
     try:
-        # First, check if we have any knowledge base entries at all
-        knowledge_count = ChatbotKnowledge.query.count()
-        logger.info(f"Total knowledge base entries: {knowledge_count}")
-        
         # Try to find a match in the knowledge base
-        # Use more flexible search
+        # Exact and partial matches come from the in-memory index built at training time
         knowledge_entry = None
         
-        # Try exact match first
-        knowledge_entry = ChatbotKnowledge.query.filter(
-            db.func.lower(ChatbotKnowledge.question) == db.func.lower(user_message)
-        ).first()
-        
-        if not knowledge_entry:
-            # Try partial match
-            knowledge_entry = ChatbotKnowledge.query.filter(
-                ChatbotKnowledge.question.ilike(f'%{user_message}%')
-            ).first()
+        with span('knowledge_lookup'):
+            if ai_model is not None:
+                knowledge_entry = ai_model.lookup_knowledge(user_message)
+            else:
+                # Try exact match first, through the unique index on the normalized question
+                knowledge_entry = ChatbotKnowledge.query.filter_by(
+                    question_normalized=normalize_question(user_message)
+                ).first()
+                
+                if not knowledge_entry:
+                    # Try partial match
+                    knowledge_entry = ChatbotKnowledge.query.filter(
+                        ChatbotKnowledge.question.ilike(f'%{user_message}%')
+                    ).first()
         
         if knowledge_entry:
             response = knowledge_entry.answer
             source = "knowledge_base"
-            logger.info(f"Found knowledge base match: {knowledge_entry.question}")
+            logger.debug("Found knowledge base match: %s", knowledge_entry.question, extra={'stage': 'knowledge_lookup'})
         else:
-            logger.info(f"No direct match found for: {user_message}")
+            logger.debug("No direct match found", extra={'stage': 'knowledge_lookup'})
             
             # Use AI model if available
-            if ai_model_available:
+            if ai_model is not None:
                 try:
-                    # Initialize model if needed
-                    if hasattr(ai_model, 'is_initialized') and not ai_model.is_initialized:
-                        initialize_model()
-                    
-                    # Get AI response
-                    response, source = ai_model.get_response(user_message, current_user.id)
-                    logger.info(f"AI model response received, source: {source}")
+                    # Get AI response (the model loads or trains itself on first use)
+                    with span('model_response'):
+                        response, source = ai_model.get_response(user_message, current_user.id)
                 except Exception as ai_error:
-                    logger.error(f"AI model error: {ai_error}")
+                    logger.error("AI model error: %s", ai_error)
                     response = "I'm currently unable to process complex questions. Please try a simpler query or contact support."
                     source = "error"
             else:
@@ -149,8 +169,14 @@ def chat_api():
                 response = "The AI service is currently unavailable. Please try asking about university services, policies, or facilities."
                 source = "fallback"
                 
+    except sa_exc.TimeoutError as e:
+        # Pool exhausted: shed the request rather than queue more work behind it
+        logger.warning("Database busy in chat_api: %s", e)
+        db.session.rollback()
+        request_seconds.observe(time.perf_counter() - started, endpoint='chat_api', source="busy")
+        return _busy_response()
     except Exception as e:
-        logger.error(f"Error in chat_api: {str(e)}", exc_info=True)
+        logger.error("Error in chat_api: %s", e, exc_info=True)
         
         # Try to provide a more helpful error message
         error_msg = str(e).lower()
@@ -162,28 +188,195 @@ def chat_api():
         else:
             response = f"I'm having trouble processing your request. Error: {str(e)[:100]}"
     
-    # Save chat history
-    try:
-        chat_entry = ChatHistory(
-            user_id=current_user.id,
-            user_message=user_message,
-            bot_response=response,
-            source=source
-        )
-        db.session.add(chat_entry)
-        db.session.commit()
-        logger.info(f"Chat history saved for user {current_user.id}")
-    except Exception as db_error:
-        logger.error(f"Error saving chat history: {db_error}")
-        # Don't fail if we can't save history
+    # Remember the turn for follow-up questions, then queue it for a batched background insert
+    with span('history_record'):
+        conversation_memory.append(current_user.id, user_message, response, source)
+        history_writer.record(current_user.id, user_message, response, source)
     
-    logger.info(f"Sending response: {response[:50]}... (source: {source})")
+    elapsed = time.perf_counter() - started
+    request_seconds.observe(elapsed, endpoint='chat_api', source=source)
+    logger.info("Chat response sent", extra={
+        'stage': 'chat_request', 'user_id': current_user.id, 'source': source,
+        'message_length': len(user_message), 'duration_ms': round(elapsed * 1000, 1)
+    })
     
     return jsonify({
         'response': response,
         'source': source
     })
 
+def _busy_response():
+    """503 with Retry-After, sent when the database pool is saturated"""
+    response = jsonify({
+        'response': "The service is busy right now. Please try again in a few seconds.",
+        'source': "busy"
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = os.environ.get('BUSY_RETRY_AFTER', '5')
+    return response
+
+@app.errorhandler(sa_exc.TimeoutError)
+def database_busy(error):
+    logger.warning("Database busy on %s: %s", request.path, error)
+    db.session.rollback()
+    return _busy_response()
+
+def _monitoring_allowed():
+    """Admins, plus monitoring agents sending MONITORING_TOKEN as a bearer token.
+
+    The remote address is only trusted when MONITORING_ALLOW_LOCALHOST is set:
+    behind a reverse proxy on the same host, every request comes from localhost.
+    """
+    if current_user.is_authenticated and current_user.role == 'admin':
+        return True
+    token = os.environ.get('MONITORING_TOKEN')
+    # compare_digest only takes ASCII str, so compare bytes: a non-ASCII header is refused, not a 500
+    authorization = request.headers.get('Authorization', '').encode('utf-8')
+    if token and hmac.compare_digest(authorization, f"Bearer {token}".encode('utf-8')):
+        return True
+    allow_localhost = os.environ.get('MONITORING_ALLOW_LOCALHOST', 'false').lower() in ('1', 'true', 'yes')
+    return allow_localhost and request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/internal/stats')
+def internal_stats():
+    if not _monitoring_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    stats = {
+        'db_pool': pool_status(db.engine),
+        'llm': llm_dispatcher.stats()
+    }
+    ai_model = get_ai_model()
+    if ai_model is not None:
+        stats['model'] = dict(ai_model.trainer.stats(), trained=ai_model.trained, generation=ai_model.generation)
+    return jsonify(stats)
+
+def _pool_gauges():
+    status = pool_status(db.engine)
+    return {(state,): status[state] for state in ('checked_out', 'checked_in', 'overflow', 'waiting') if state in status}
+
+registry.register(Gauge(
+    'db_pool_connections', "Database pool connections by state, read at scrape time", labels=('state',), callback=_pool_gauges
+))
+registry.register(Gauge(
+    'llm_pending_requests', "LLM calls running or queued on the dispatch pool", callback=lambda: {(): llm_dispatcher.stats()['pending']}
+))
+
+@app.route('/metrics')
+def metrics():
+    """Latency histograms and counters in the Prometheus text format"""
+    if not _monitoring_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def _sse_event(payload, event=None):
+    """Format a payload as a Server-Sent Events message"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(payload)}\n\n"
+
+@app.route('/chat_api/stream', methods=['POST'])
+@login_required
+def chat_api_stream():
+    data = request.get_json()
+    user_message = data.get('message', '').strip()
+    user_id = current_user.id
+    
+    logger.debug("Received streaming message from user %s: %s", user_id, user_message, extra={'stage': 'chat_request'})
+    
+    ai_model = get_ai_model()
+    
+    def generate():
+        started = time.perf_counter()
+        if not user_message:
+            yield _sse_event({'response': "I didn't receive a message. Please try again.", 'source': "error"}, event='done')
+            return
+        
+        parts = []
+        source = "error"
+        
+        try:
+            with span('knowledge_lookup'):
+                knowledge_entry = ai_model.lookup_knowledge(user_message) if ai_model is not None else None
+            
+            if knowledge_entry:
+                chunks = [(knowledge_entry.answer, "knowledge_base")]
+            elif ai_model is not None:
+                chunks = ai_model.stream_response(user_message, user_id)
+            else:
+                chunks = [("The AI service is currently unavailable. Please try asking about university services, policies, or facilities.", "fallback")]
+            
+            for text, source in chunks:
+                parts.append(text)
+                yield _sse_event({'delta': text, 'source': source})
+        except Exception as e:
+            logger.error("Error in chat_api_stream: %s", e, exc_info=True)
+            text = "I'm having trouble processing your request. Please try again later."
+            parts.append(text)
+            source = "error"
+            yield _sse_event({'delta': text, 'source': source})
+        
+        response = ''.join(parts).strip()
+        
+        # Save the full text once the stream has ended
+        with span('history_record'):
+            conversation_memory.append(user_id, user_message, response, source)
+            history_writer.record(user_id, user_message, response, source)
+        elapsed = time.perf_counter() - started
+        request_seconds.observe(elapsed, endpoint='chat_api_stream', source=source)
+        logger.info("Chat stream finished", extra={
+            'stage': 'chat_request', 'user_id': user_id, 'source': source,
+            'message_length': len(user_message), 'duration_ms': round(elapsed * 1000, 1)
+        })
+        
+        yield _sse_event({'response': response, 'source': source}, event='done')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/chat_history')
+@login_required
+def chat_history():
+    """The current user's turns, newest page first, each page in chronological order.
+
+    ?limit= sets the page size (default 20, at most 100). Pass the returned
+    next_cursor as ?before= to load the older turns before them.
+    """
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    
+    # Only the columns the chat page shows, walked through the (user_id, timestamp) index
+    query = db.session.query(
+        ChatHistory.id, ChatHistory.user_message, ChatHistory.bot_response, ChatHistory.source, ChatHistory.timestamp
+    ).filter(ChatHistory.user_id == current_user.id)
+    
+    before = request.args.get('before')
+    if before:
+        try:
+            timestamp, row_id = decode_time_cursor(before)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(db.or_(
+            ChatHistory.timestamp < timestamp,
+            db.and_(ChatHistory.timestamp == timestamp, ChatHistory.id < row_id)
+        ))
+    
+    rows = query.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_time_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    
+    return jsonify({
+        'items': [{
+            'id': row.id,
+            'user_message': row.user_message,
+            'bot_response': row.bot_response,
+            'source': row.source,
+            'timestamp': row.timestamp.isoformat()
+        } for row in reversed(rows[:limit])],
+        'next_cursor': next_cursor
+    })
+
 # Feedback routes (unchanged)
 @app.route('/feedback', methods=['GET', 'POST'])
 @login_required
@@ -196,6 +389,7 @@ def feedback():
             rating=form.rating.data
         )
         db.session.add(feedback)
+        record_rating(feedback.rating)
         db.session.commit()
         flash('Thank you for your feedback!', 'success')
         return redirect(url_for('index'))
@@ -219,8 +413,85 @@ def admin_users():
         flash('You do not have permission to access this page.', 'danger')
         return redirect(url_for('index'))
     
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    role = request.args.get('role', '').strip()
+    email = request.args.get('email', '').strip()
+    users, next_cursor = _users_listing(role, email, request.args.get('after', type=int), page_size())
+    return render_template('admin/users.html', users=users, next_cursor=next_cursor, role=role, email=email)
+
+def _users_listing(role, email_prefix, after, per_page):
+    """One keyset page of users, filtered by exact role and email prefix"""
+    query = User.query
+    if role:
+        query = query.filter(User.role == role)
+    if email_prefix:
+        # A prefix LIKE can use the unique index on email
+        query = query.filter(User.email.startswith(email_prefix, autoescape=True))
+    return keyset_page(query, User.id, cursor=after, per_page=per_page)
+
+def _knowledge_listing(search, after, per_page):
+    """One keyset page of knowledge entries, optionally filtered by question substring"""
+    if not search:
+        return keyset_page(ChatbotKnowledge.query, ChatbotKnowledge.id, cursor=after, per_page=per_page)
+    
+    # The n-gram index finds matching ids; only this page's rows are read from the database
+    ai_model = get_ai_model()
+    ids = ai_model.search_knowledge(search, after=after, limit=per_page + 1) if ai_model is not None else None
+    if ids is None:
+        # No model, or it is still loading: scan with LIKE instead
+        query = ChatbotKnowledge.query.filter(
+            ChatbotKnowledge.question_normalized.contains(normalize_question(search), autoescape=True)
+        )
+        return keyset_page(query, ChatbotKnowledge.id, cursor=after, per_page=per_page)
+    
+    next_cursor = ids[per_page - 1] if len(ids) > per_page else None
+    ids = ids[:per_page]
+    entries = ChatbotKnowledge.query.filter(ChatbotKnowledge.id.in_(ids)).order_by(ChatbotKnowledge.id).all() if ids else []
+    return entries, next_cursor
+
+@app.route('/admin/api/users')
+@login_required
+def admin_api_users():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    users, next_cursor = _users_listing(
+        request.args.get('role', '').strip(),
+        request.args.get('email', '').strip(),
+        request.args.get('after', type=int),
+        page_size()
+    )
+    return jsonify({
+        'items': [{
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'role': user.role,
+            'created_at': user.created_at.isoformat() if user.created_at else None
+        } for user in users],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/admin/api/knowledge')
+@login_required
+def admin_api_knowledge():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    entries, next_cursor = _knowledge_listing(
+        request.args.get('q', '').strip(),
+        request.args.get('after', type=int),
+        page_size()
+    )
+    return jsonify({
+        'items': [{
+            'id': entry.id,
+            'question': entry.question,
+            # Keep list payloads small; the edit page has the full answer
+            'answer_preview': entry.answer[:200],
+            'updated_at': entry.updated_at.isoformat() if entry.updated_at else None
+        } for entry in entries],
+        'next_cursor': next_cursor
+    })
 
 # ADDED DELETE USER ROUTE HERE
 @app.route('/admin/users/<int:id>/delete', methods=['POST'])
@@ -245,15 +516,18 @@ def delete_user(id):
             flash('Cannot delete the last admin account!', 'danger')
             return redirect(url_for('admin_users'))
     
- 
-    @app.route('/admin/users/delete/<int:id>', methods=['POST'])
-    @login_required
-    def delete_user(id):
-        user = User.query.get_or_404(id)
-        db.session.delete(user)
-        db.session.commit()
-        flash('User deleted successfully', 'success')
-        return redirect(url_for('manage_users'))
+    # Remove rows that reference the user before the user itself, including turns
+    # still waiting in the history queue
+    history_writer.flush()
+    ChatHistory.query.filter_by(user_id=id).delete()
+    remove_user_feedback(id)
+    db.session.delete(user_to_delete)
+    db.session.commit()
+    user_cache.invalidate(id)
+    conversation_memory.forget(id)
+    
+    flash('User deleted successfully', 'success')
+    return redirect(url_for('admin_users'))
 
 
 @app.route('/admin/knowledge', methods=['GET', 'POST'])
@@ -271,11 +545,18 @@ def admin_knowledge():
         )
         db.session.add(knowledge)
         db.session.commit()
+        
+        # Make the new entry answerable without a full retrain
+        ai_model = get_ai_model()
+        if ai_model is not None:
+            ai_model.add_entry(knowledge)
         flash('Knowledge base entry added successfully!', 'success')
         return redirect(url_for('admin_knowledge'))
     
-    knowledge_entries = ChatbotKnowledge.query.all()
-    return render_template('admin/knowledge.html', form=form, knowledge_entries=knowledge_entries)
+    search = request.args.get('q', '').strip()
+    knowledge_entries, next_cursor = _knowledge_listing(search, request.args.get('after', type=int), page_size())
+    return render_template('admin/knowledge.html', form=form, knowledge_entries=knowledge_entries,
+                           next_cursor=next_cursor, search=search)
 
 @app.route('/admin/knowledge/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -285,13 +566,17 @@ def edit_knowledge(id):
         return redirect(url_for('index'))
     
     knowledge = ChatbotKnowledge.query.get_or_404(id)
-    form = KnowledgeForm(obj=knowledge)
+    form = KnowledgeForm(obj=knowledge, knowledge_id=knowledge.id)
     
     if form.validate_on_submit():
         knowledge.question = form.question.data
         knowledge.answer = form.answer.data
         knowledge.updated_at = datetime.utcnow()
         db.session.commit()
+        
+        ai_model = get_ai_model()
+        if ai_model is not None:
+            ai_model.update_entry(knowledge)
         flash('Knowledge base entry updated successfully!', 'success')
         return redirect(url_for('admin_knowledge'))
     
@@ -307,6 +592,10 @@ def delete_knowledge(id):
     knowledge = ChatbotKnowledge.query.get_or_404(id)
     db.session.delete(knowledge)
     db.session.commit()
+    
+    ai_model = get_ai_model()
+    if ai_model is not None:
+        ai_model.remove_entry(id)
     flash('Knowledge base entry deleted successfully!', 'success')
     return redirect(url_for('admin_knowledge'))
 
@@ -317,20 +606,15 @@ def admin_feedback():
         flash('You do not have permission to access this page.', 'danger')
         return redirect(url_for('index'))
     
-    feedback = Feedback.query.all()
-    
-    # Calculate average rating 
-    avg_rating = 0
-    if feedback:
-        total_rating = sum(f.rating for f in feedback)
-        avg_rating = round(total_rating / len(feedback), 1) if len(feedback) > 0 else 0
+    # Totals come from the rating rollup; detail rows are paged by id
+    total_feedback, avg_rating, rating_counts = rating_summary()
+    feedback, next_cursor = feedback_page(
+        before=request.args.get('before', type=int),
+        per_page=page_size()
+    )
     
-    # Calculate rating counts
-    rating_counts = {}
-    for i in range(1, 6):
-        rating_counts[i] = sum(1 for f in feedback if f.rating == i)
-    
-    return render_template('admin/feedback.html', feedback=feedback, avg_rating=avg_rating, rating_counts=rating_counts)
+    return render_template('admin/feedback.html', feedback=feedback, avg_rating=avg_rating, rating_counts=rating_counts,
+                           total_feedback=total_feedback, next_cursor=next_cursor)
 
 # Profile route (unchanged)
 @app.route('/profile', methods=['GET', 'POST'])
@@ -339,17 +623,21 @@ def profile():
     form = ProfileUpdateForm(original_username=current_user.username, original_email=current_user.email)
     
     if form.validate_on_submit():
+        # current_user is a cached snapshot; changes go through the User row
+        user = db.session.get(User, current_user.id)
+        
         # Verify current password
-        if check_password_hash(current_user.password, form.current_password.data):
+        if check_password_hash(user.password, form.current_password.data):
             # Update username and email
-            current_user.username = form.username.data
-            current_user.email = form.email.data
+            user.username = form.username.data
+            user.email = form.email.data
             
             # Update password if provided
             if form.new_password.data:
-                current_user.password = generate_password_hash(form.new_password.data)
+                user.password = generate_password_hash(form.new_password.data)
                 
             db.session.commit()
+            user_cache.invalidate(user.id)
             flash('Your profile has been updated successfully!', 'success')
             return redirect(url_for('profile'))
         else:
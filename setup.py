@@ -66,6 +66,9 @@ def setup_environment():
         from app import app, db
         with app.app_context():
             db.create_all()
+            # Record the schema revisions so migrate_db.py has nothing to redo
+            from migrate_db import migrate
+            migrate()
         print("✓ Database tables initialized successfully.")
     except Exception as e:
         print(f"✗ Error initializing database: {e}")
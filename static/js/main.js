@@ -34,6 +34,131 @@ const AIChat = {
         } catch (e) {
             console.error('Error saving chat history:', e);
         }
+    },
+
+    // Load the user's saved turns from the server, oldest first within the page.
+    // Resolves to {items, next_cursor}; pass next_cursor as `before` for older turns.
+    loadHistory: function(limit, before) {
+        const query = new URLSearchParams({limit: limit || 20});
+        if (before) {
+            query.set('before', before);
+        }
+        return fetch('/chat_history?' + query.toString()).then(function(response) {
+            if (!response.ok) {
+                throw new Error('History request failed with status ' + response.status);
+            }
+            return response.json();
+        });
+    },
+
+    // Send a message to the streaming endpoint and report text as it arrives.
+    // handlers: onDelta(text, source), onDone(response, source), onError(error)
+    streamMessage: function(message, handlers) {
+        const csrfMeta = document.querySelector('meta[name="csrf-token"]');
+        const headers = {'Content-Type': 'application/json'};
+        if (csrfMeta) {
+            headers['X-CSRFToken'] = csrfMeta.getAttribute('content');
+        }
+
+        return fetch('/chat_api/stream', {
+            method: 'POST',
+            headers: headers,
+            body: JSON.stringify({message: message})
+        }).then(function(response) {
+            if (!response.ok || !response.body) {
+                throw new Error('Streaming request failed with status ' + response.status);
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            // Parse one "event: ...\ndata: ...\n\n" block
+            const handleEvent = function(block) {
+                let eventName = 'message';
+                let data = '';
+                block.split('\n').forEach(function(line) {
+                    if (line.startsWith('event:')) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        data += line.slice(5).trim();
+                    }
+                });
+                if (!data) {
+                    return;
+                }
+                const payload = JSON.parse(data);
+                if (eventName === 'done') {
+                    if (handlers.onDone) {
+                        handlers.onDone(payload.response, payload.source);
+                    }
+                    AIChat.saveHistory(message, payload.response, payload.source);
+                } else if (handlers.onDelta) {
+                    handlers.onDelta(payload.delta, payload.source);
+                }
+            };
+
+            const read = function() {
+                return reader.read().then(function(result) {
+                    if (result.done) {
+                        if (buffer.trim()) {
+                            handleEvent(buffer);
+                        }
+                        return;
+                    }
+                    buffer += decoder.decode(result.value, {stream: true});
+                    let boundary = buffer.indexOf('\n\n');
+                    while (boundary !== -1) {
+                        handleEvent(buffer.slice(0, boundary));
+                        buffer = buffer.slice(boundary + 2);
+                        boundary = buffer.indexOf('\n\n');
+                    }
+                    return read();
+                });
+            };
+
+            return read();
+        }).catch(function(error) {
+            console.error('Error streaming chat response:', error);
+            if (handlers.onError) {
+                handlers.onError(error);
+            }
+        });
+    }
+};
+
+// Admin listing helpers for infinite scroll over /admin/api/users and /admin/api/knowledge
+const AdminList = {
+    // Returns a feed whose next() resolves to the next page of items ([] once exhausted).
+    // params are query-string filters, e.g. {q: 'library'} or {role: 'admin', email: 'jo'}
+    createFeed: function(url, params) {
+        let cursor = null;
+        let done = false;
+
+        return {
+            hasMore: function() {
+                return !done;
+            },
+            next: function() {
+                if (done) {
+                    return Promise.resolve([]);
+                }
+                const query = new URLSearchParams(params || {});
+                if (cursor !== null) {
+                    query.set('after', cursor);
+                }
+                return fetch(url + '?' + query.toString()).then(function(response) {
+                    if (!response.ok) {
+                        throw new Error('Listing request failed with status ' + response.status);
+                    }
+                    return response.json();
+                }).then(function(page) {
+                    cursor = page.next_cursor;
+                    done = cursor === null;
+                    return page.items;
+                });
+            }
+        };
     }
 };
 
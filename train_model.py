@@ -3,42 +3,84 @@ import sys
 from app import app, db
 from models import ChatbotKnowledge
 from ai_model import ai_model
+from knowledge_index import normalize_question
 
-def train_model_from_csv(csv_file):
-    """Train the AI model with data from a CSV file"""
+def import_knowledge_csv(csv_file, chunk_size=1000, validate_header=False):
+    """Stream question/answer rows from a CSV file into the knowledge base.
+    
+    Existing normalized questions are fetched once into a set and new rows are
+    written with one multi-row INSERT per chunk. Returns (valid_rows,
+    added_rows), or None if the file is missing or malformed.
+    """
     import csv
     
     if not os.path.exists(csv_file):
         print(f"Error: CSV file {csv_file} not found.")
-        return False
+        return None
     
-    try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            next(reader)  # Skip header row
+    # One narrow query instead of a SELECT per CSV row
+    seen = {key for (key,) in db.session.query(ChatbotKnowledge.question_normalized)}
+    
+    valid_rows = 0
+    added_rows = 0
+    chunk = []
+    
+    def flush():
+        if chunk:
+            db.session.execute(ChatbotKnowledge.__table__.insert(), chunk)
+            db.session.commit()
+            chunk.clear()
+    
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if validate_header and (header is None or len(header) < 2 or header[0].strip().lower() != 'question' or header[1].strip().lower() != 'answer'):
+            print("Error: CSV file has invalid format. Expected headers: question,answer")
+            return None
+        
+        for row in reader:
+            if len(row) < 2:  # Ensure we have question and answer
+                continue
+            valid_rows += 1
             
-            # Process each row and add to database
-            count = 0
-            for row in reader:
-                if len(row) >= 2:  # Ensure we have question and answer
-                    question = row[0].strip()
-                    answer = row[1].strip()
-                    
-                    # Check if question already exists
-                    existing = ChatbotKnowledge.query.filter_by(question=question).first()
-                    if not existing:
-                        # Add new knowledge entry
-                        knowledge = ChatbotKnowledge(question=question, answer=answer)
-                        db.session.add(knowledge)
-                        count += 1
+            question = row[0].strip()
+            answer = row[1].strip()
+            key = normalize_question(question)
             
-            # Commit changes to database
-            db.session.commit()
-            print(f"Added {count} new knowledge entries to database.")
+            # Skip questions already in the database or earlier in this file
+            if not key or key in seen:
+                continue
+            seen.add(key)
             
-            # Train the model with new data
-            return ai_model.train()
+            chunk.append({'question': question, 'question_normalized': key, 'answer': answer})
+            added_rows += 1
+            if len(chunk) >= chunk_size:
+                flush()
+    
+    flush()
+    return valid_rows, added_rows
+
+def train_model_from_csv(csv_file, validate_header=False):
+    """Import a CSV file into the knowledge base and train the AI model once at the end"""
+    try:
+        result = import_knowledge_csv(csv_file, validate_header=validate_header)
+        if result is None:
+            return False
+        
+        valid_rows, added_rows = result
+        print(f"Found {valid_rows} valid entries in {csv_file}")
+        if validate_header and valid_rows == 0:
+            print("Error: No valid entries found in CSV file")
+            return False
+        print(f"Added {added_rows} new knowledge entries to database.")
+        
+        # Train the model with new data and save it so workers can warm start
+        if not ai_model.train():
+            return False
+        ai_model.save()
+        return True
     except Exception as e:
+        db.session.rollback()
         print(f"Error processing CSV file: {e}")
         return False
 
@@ -54,6 +96,8 @@ def main():
             # Train with existing database data
             print("Training model with existing database data...")
             success = ai_model.train()
+            if success:
+                ai_model.save()
         
         if success:
             print("Model training completed successfully.")
@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from flask_login import UserMixin
+from app import db
+from models import User
+
+class CachedUser(UserMixin):
+    """Read-only snapshot of a User, used as current_user.
+
+    Only the columns requests read are copied; the password hash stays in
+    the database. Code that changes the user loads the User row itself.
+    """
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.role = user.role
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+class UserCache:
+    """Short-TTL cache of CachedUser snapshots keyed by user id and version.
+
+    invalidate() bumps the user's version, so an entry loaded before a
+    profile update, role change or delete is never served again by this
+    process. Other processes pick up the change when their entry expires
+    after ttl seconds.
+    """
+
+    def __init__(self, ttl=60, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Return the CachedUser for user_id, loading it on a miss, or None if there is no such user"""
+        now = time.monotonic()
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+            entry = self._entries.get(user_id)
+            if entry and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                return entry[2]
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = CachedUser(user)
+
+        with self._lock:
+            # Skip the store if the user was invalidated while we were loading
+            if self._versions.get(user_id, 0) == version:
+                self._entries[user_id] = (version, now + self.ttl, snapshot)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        """Drop the cached snapshot for user_id and bump its version"""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            for user_id in self._entries:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.clear()
+
+# Shared cache, configured from the environment
+user_cache = UserCache(
+    ttl=float(os.environ.get('USER_CACHE_TTL', '60')),
+    max_size=int(os.environ.get('USER_CACHE_SIZE', '10000'))
+)